@@ -0,0 +1,224 @@
+"""
+Admission control in front of the prediction routes.
+
+An advisory that arrives after the driver has passed the stop line is
+worse than no advisory, so work the service cannot finish in time is
+refused up front instead of queueing behind everything else:
+
+- with a rate configured, each client has a token bucket and an empty
+  bucket is answered 429 with Retry-After. A client is its peer address;
+  only trusted proxies (the Node backend, which forwards every vehicle)
+  may name the client they forward for with X-Client-Id, and their own
+  requests without it are not rate limited. Other callers cannot pick
+  their bucket, so rotating ids does not get round the limit;
+- at most max_concurrent requests run at once, and up to max_queue more
+  wait in earliest-deadline-first order; a full queue is answered 503;
+- a client may send X-Request-Budget-Ms. A request whose budget is shorter
+  than the expected queueing plus service time is shed with 503 at once,
+  and one whose budget runs out while it waits is shed when it expires.
+
+Service time is an EWMA of how long admitted requests held their slot.
+"""
+import asyncio
+import collections
+import heapq
+import itertools
+import json
+import math
+import time
+
+from metrics import ADMITTED_KEY
+
+BUDGET_HEADER = b"x-request-budget-ms"
+CLIENT_HEADER = b"x-client-id"
+SHED_REASONS = ("rate_limited", "queue_full", "deadline")
+
+
+class TokenBuckets:
+    """Per-client token buckets, forgetting the least recently seen clients past max_clients."""
+
+    def __init__(self, rate, burst, max_clients=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self._buckets = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, client):
+        """Spend one token; returns 0.0 on success, else seconds until a token is available."""
+        now = self.clock()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            # A forgotten client comes back with a full bucket, which is what it would have refilled to
+            bucket = self._buckets[client] = [self.burst, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1.0:
+            bucket[0] = tokens - 1.0
+            return 0.0
+        bucket[0] = tokens
+        return (1.0 - tokens) / self.rate
+
+
+class AdmissionController:
+    def __init__(self, rate=None, burst=None, max_concurrent=256, max_queue=1024,
+                 service_alpha=0.05, initial_service_time=0.002, clock=time.monotonic):
+        # No rate means no per-client limit; burst defaults to two seconds' worth
+        self.buckets = TokenBuckets(rate, burst or 2 * rate, clock=clock) if rate else None
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.service_alpha = service_alpha
+        self.service_time = initial_service_time
+        self.clock = clock
+
+        self.running = 0
+        self._waiting = []  # heap of (deadline, seq, future)
+        self._seq = itertools.count()
+
+        self.admitted = 0
+        self.shed = dict.fromkeys(SHED_REASONS, 0)
+
+    @property
+    def queue_depth(self):
+        return len(self._waiting)
+
+    def expected_delay(self):
+        # Everything queued ahead drains max_concurrent at a time, then this request is served
+        waves = len(self._waiting) // self.max_concurrent + (self.running >= self.max_concurrent)
+        return (waves + 1) * self.service_time
+
+    async def acquire(self, client, budget):
+        """Take a slot or return the shed reason and a Retry-After hint in seconds.
+
+        `client` is None for requests exempt from the per-client rate limit.
+        """
+        if self.buckets is not None and client is not None:
+            retry_after = self.buckets.take(client)
+            if retry_after:
+                self.shed["rate_limited"] += 1
+                return "rate_limited", retry_after
+
+        now = self.clock()
+        deadline = now + budget if budget is not None else math.inf
+        if budget is not None and budget < self.expected_delay():
+            self.shed["deadline"] += 1
+            return "deadline", self.expected_delay()
+
+        if self.running < self.max_concurrent and not self._waiting:
+            self.running += 1
+            self.admitted += 1
+            return None, 0.0
+        if len(self._waiting) >= self.max_queue:
+            self.shed["queue_full"] += 1
+            return "queue_full", self.expected_delay()
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (deadline, next(self._seq), future))
+        # Stop waiting once there is no longer time left to be served
+        timeout = None if budget is None else max(0.0, deadline - self.service_time - now)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                self._drop(future)
+                self.shed["deadline"] += 1
+                return "deadline", self.expected_delay()
+        except asyncio.CancelledError:
+            # Client went away while queued; hand a slot we were just given to the next waiter
+            if future.done():
+                self.release(None)
+            else:
+                self._drop(future)
+            raise
+        # release() already counted this request as running
+        self.admitted += 1
+        return None, 0.0
+
+    def _drop(self, future):
+        future.cancel()
+        self._waiting = [entry for entry in self._waiting if entry[2] is not future]
+        heapq.heapify(self._waiting)
+
+    def release(self, held):
+        """Free a slot; `held` is how long it was used, or None if it was never used."""
+        if held is not None:
+            self.service_time += self.service_alpha * (held - self.service_time)
+        if self._waiting:
+            # Waiters are dropped from the heap when they give up, so the slot passes straight on
+            _, _, future = heapq.heappop(self._waiting)
+            future.set_result(None)
+        else:
+            self.running -= 1
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "queue_depth": self.queue_depth,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "service_time_ms": 1000 * self.service_time,
+            "client_rate": self.buckets.rate if self.buckets is not None else None,
+            "clients": len(self.buckets) if self.buckets is not None else 0,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+        }
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying an AdmissionController to HTTP paths under `prefixes`."""
+
+    def __init__(self, app, controller, prefixes, trusted_proxies=()):
+        self.app = app
+        self.controller = controller
+        self.prefixes = tuple(prefixes)
+        self.trusted_proxies = frozenset(trusted_proxies)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            return await self.app(scope, receive, send)
+
+        forwarded_for, budget = None, None
+        for name, value in scope["headers"]:
+            if name == CLIENT_HEADER:
+                forwarded_for = value.decode("latin-1")
+            elif name == BUDGET_HEADER:
+                try:
+                    budget = max(0.0, float(value) / 1000)
+                except ValueError:
+                    pass
+        peer = scope["client"][0] if scope.get("client") else "unknown"
+        client = forwarded_for if peer in self.trusted_proxies else peer
+
+        controller = self.controller
+        reason, retry_after = await controller.acquire(client, budget)
+        if reason is not None:
+            return await shed_response(send, reason, retry_after)
+
+        # Downstream stage timers start here, so queueing is reported apart
+        start = scope[ADMITTED_KEY] = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(time.perf_counter() - start)
+
+
+async def shed_response(send, reason, retry_after):
+    status = 429 if reason == "rate_limited" else 503
+    body = json.dumps({"detail": f"request shed: {reason}"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
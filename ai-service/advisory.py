@@ -0,0 +1,72 @@
+"""
+GLOSA speed advisory, vectorized over whole fleets.
+
+A NumPy port of calculateAdvisory and getDistance from
+backend/utils/glosa.js. Thresholds and messages match the Node version so
+both paths give drivers the same advice.
+"""
+import numpy as np
+
+from phases import GREEN, RED
+
+EARTH_RADIUS = 6371e3  # metres
+MIN_SPEED = 5.0  # m/s (~18 km/h)
+MAX_SPEED = 16.0  # m/s (~60 km/h)
+TARGET_BUFFER = 2.0  # seconds buffer to pass during green
+
+MESSAGES = np.array([
+    "Maintain speed to clear signal.",
+    "Slow down. Signal turning Red soon.",
+    "Optimal speed to arrive at Green.",
+    "Slow approach. Arrive after signal turns Green.",
+    "Stop and wait for Green.",
+    "Prepare to stop.",
+])
+(MAINTAIN, SLOW_DOWN, OPTIMAL, SLOW_APPROACH, STOP, PREPARE) = range(len(MESSAGES))
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres between broadcastable coordinate arrays."""
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(np.subtract(lon2, lon1))
+
+    a = np.sin(d_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def calculate_advisory(distance, seconds_to_change, status):
+    """Return (recommended speed in km/h, message codes) for every vehicle."""
+    distance = np.asarray(distance, dtype=np.float64)
+    seconds_to_change = np.asarray(seconds_to_change, dtype=np.float64)
+    status = np.asarray(status)
+
+    speed = np.full(distance.shape, MIN_SPEED)
+    message = np.full(distance.shape, PREPARE, dtype=np.int8)
+
+    # Division follows JavaScript semantics: x / 0 is Infinity, not an error
+    with np.errstate(divide="ignore", invalid="ignore"):
+        clear_speed = distance / (seconds_to_change - TARGET_BUFFER)
+        arrive_speed = distance / (seconds_to_change + TARGET_BUFFER)
+
+    # GREEN: can we make it before it turns red?
+    green = status == GREEN
+    can_clear = green & (clear_speed <= MAX_SPEED)
+    speed[can_clear] = np.maximum(clear_speed[can_clear], MIN_SPEED)
+    message[can_clear] = MAINTAIN
+    message[green & ~can_clear] = SLOW_DOWN
+
+    # RED: arrive just as it turns green
+    red = status == RED
+    optimal = red & (arrive_speed >= MIN_SPEED) & (arrive_speed <= MAX_SPEED)
+    speed[optimal] = arrive_speed[optimal]
+    message[optimal] = OPTIMAL
+    slow_approach = red & (arrive_speed < MIN_SPEED)
+    message[slow_approach] = SLOW_APPROACH
+    stop = red & ~optimal & ~slow_approach
+    speed[stop] = 0.0
+    message[stop] = STOP
+
+    # Math.round rounds halves up
+    return np.floor(speed * 3.6 + 0.5).astype(np.int64), message
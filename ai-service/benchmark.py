@@ -0,0 +1,341 @@
+"""
+Load benchmark for the prediction service.
+
+Drives the FastAPI app either in-process through its ASGI interface or over
+HTTP against a local uvicorn, with a configurable number of concurrent
+clients and a weighted mix of single, batch and streaming calls. Reports
+throughput and latency percentiles and stores them as JSON so runs from
+different commits can be compared:
+
+    python benchmark.py --target both --concurrency 64 --mix single=8,batch=1,stream=1
+    python benchmark.py compare bench_results/old.json bench_results/new.json
+
+The wire subcommand compares payload size and encode time of the response
+encodings for one batch of predictions:
+
+    python benchmark.py wire --size 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# All load comes from one peer; a per-client limit would measure the limiter, not the service
+SERVICE_ENV = {k: v for k, v in os.environ.items() if k != "GLOSA_CLIENT_RATE"}
+KINDS = ("single", "batch", "stream")
+
+
+def parse_mix(text):
+    weights = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in KINDS:
+            raise argparse.ArgumentTypeError(f"unknown call kind {kind!r}; use {', '.join(KINDS)}")
+        weights[kind] = float(weight or 1)
+    return weights
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def summarize(latencies, errors, elapsed):
+    if not latencies:
+        return {"count": 0, "errors": errors, "throughput": 0.0}
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "count": len(ms),
+        "errors": errors,
+        "throughput": len(ms) / elapsed,
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(ms.max()),
+    }
+
+
+async def asgi_first_event(app, path, query):
+    # httpx buffers whole ASGI responses, which never ends for SSE, so the
+    # in-process stream call speaks ASGI directly and disconnects after the
+    # first event
+    first_event = asyncio.Event()
+    disconnect = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            first_event.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query.encode(), "headers": [], "client": ("bench", 0),
+        "server": ("bench", 80), "root_path": "",
+    }
+    task = asyncio.ensure_future(app(scope, receive, send))
+    try:
+        await first_event.wait()
+    finally:
+        disconnect.set()
+        try:
+            await asyncio.wait_for(task, 1)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            task.cancel()
+
+
+class Workload:
+    def __init__(self, junction_ids, batch_size, stream_size):
+        self.junction_ids = junction_ids
+        self.batch_size = batch_size
+        self.stream_size = stream_size
+
+    def single(self):
+        return {"junction_id": random.choice(self.junction_ids), "timestamp": time.time()}
+
+    def batch(self):
+        return {
+            "junction_ids": random.choices(self.junction_ids, k=self.batch_size),
+            "timestamps": [time.time()],
+        }
+
+    def stream_query(self):
+        return "junction_ids=" + ",".join(random.sample(
+            self.junction_ids, min(self.stream_size, len(self.junction_ids))
+        ))
+
+
+async def run_load(client, stream, workload, mix, concurrency, duration):
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    latencies = {kind: [] for kind in kinds}
+    errors = {kind: 0 for kind in kinds}
+    deadline = time.perf_counter() + duration
+
+    async def call(kind):
+        if kind == "single":
+            response = await client.post("/predict", json=workload.single())
+            response.raise_for_status()
+        elif kind == "batch":
+            response = await client.post("/predict/batch", json=workload.batch())
+            response.raise_for_status()
+        else:
+            await stream(workload.stream_query())
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            kind = random.choices(kinds, weights)[0]
+            start = time.perf_counter()
+            try:
+                await call(kind)
+            except Exception:
+                errors[kind] += 1
+                continue
+            latencies[kind].append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    results = {kind: summarize(latencies[kind], errors[kind], elapsed) for kind in kinds}
+    results["total"] = summarize(
+        [x for kind in kinds for x in latencies[kind]], sum(errors.values()), elapsed
+    )
+    return results
+
+
+async def bench_inproc(workload, args):
+    sys.path.insert(0, HERE)
+    os.environ.pop("GLOSA_CLIENT_RATE", None)
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async with main.lifespan(main.app):
+            return await run_load(
+                client, lambda query: asgi_first_event(main.app, "/stream/sse", query),
+                workload, args.mix, args.concurrency, args.duration,
+            )
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def bench_uvicorn(workload, args):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=SERVICE_ENV,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start")
+
+            async def stream(query):
+                async with client.stream("GET", f"/stream/sse?{query}") as response:
+                    async for _ in response.aiter_raw():
+                        break
+
+            return await run_load(client, stream, workload, args.mix, args.concurrency, args.duration)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def print_results(report):
+    for target, results in report["results"].items():
+        print(f"[{target}]")
+        for kind, r in results.items():
+            if not r["count"]:
+                print(f"  {kind:<7} no successful calls ({r['errors']} errors)")
+                continue
+            print(f"  {kind:<7} {r['throughput']:9.1f} req/s  p50 {r['p50_ms']:7.2f} ms  "
+                  f"p95 {r['p95_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms  errors {r['errors']}")
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['commit']} -> {new['commit']}")
+    for target, results in new["results"].items():
+        for kind, r in results.items():
+            before = old["results"].get(target, {}).get(kind)
+            if not before or not before["count"] or not r["count"]:
+                continue
+            print(f"  {target}/{kind:<7}"
+                  f" throughput {100 * (r['throughput'] / before['throughput'] - 1):+6.1f}%"
+                  f"  p50 {100 * (r['p50_ms'] / before['p50_ms'] - 1):+6.1f}%"
+                  f"  p99 {100 * (r['p99_ms'] / before['p99_ms'] - 1):+6.1f}%")
+
+
+def bench_wire(size, repeat):
+    sys.path.insert(0, HERE)
+    import wire
+    from main import PredictionResponse, predict_phases, prediction_document
+    from signal_plans import load_registry
+
+    ids = load_registry().ids or ["J1"]
+    junction_ids = [ids[i % len(ids)] for i in range(size)]
+    timestamps = time.time() + np.arange(size, dtype=np.float64)
+    columns = predict_phases(junction_ids, timestamps)
+    document = prediction_document(junction_ids, columns)
+    labels = document["current_status"]
+
+    def per_item():
+        # What response_model validation of one PredictionResponse per item costs
+        items = [
+            PredictionResponse(junction_id=j, current_status=s, seconds_to_change=t, cycle_time=c)
+            for j, s, t, c in zip(junction_ids, labels, columns["seconds_to_change"].tolist(),
+                                  columns["cycle_time"].tolist())
+        ]
+        return json.dumps([item.model_dump() for item in items]).encode()
+
+    encoders = {"pydantic": per_item, "json": lambda: wire.dumps_json(document)}
+    if wire.MSGPACK in wire.available():
+        encoders["msgpack"] = lambda: wire.dumps_msgpack(document)
+    encoders["struct"] = lambda: wire.pack_columns(wire.PREDICTION, wire.PREDICTION_COLUMNS, columns)
+
+    print(f"{size} predictions, best of {repeat}")
+    for name, encode in encoders.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = encode()
+            best = min(best, time.perf_counter() - start)
+        print(f"  {name:<9} {len(body):9d} bytes  {1e3 * best:8.3f} ms")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "wire":
+        parser = argparse.ArgumentParser(prog="benchmark.py wire")
+        parser.add_argument("--size", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=20)
+        args = parser.parse_args(sys.argv[2:])
+        bench_wire(args.size, args.repeat)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        if len(sys.argv) != 4:
+            sys.exit("usage: benchmark.py compare OLD.json NEW.json")
+        compare(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target", choices=("inproc", "uvicorn", "both"), default="inproc")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per target")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("single=8,batch=1,stream=1"))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--stream-size", type=int, default=10, help="junctions per stream subscription")
+    parser.add_argument("--junctions", type=int, default=0,
+                        help="synthetic junction ids to draw from (default: registry ids)")
+    parser.add_argument("--output", help="JSON report path (default: bench_results/<commit>.json)")
+    args = parser.parse_args()
+
+    sys.path.insert(0, HERE)
+    from signal_plans import load_registry
+
+    junction_ids = [f"J{i}" for i in range(1, args.junctions + 1)] or load_registry().ids or ["J1"]
+    workload = Workload(junction_ids, args.batch_size, args.stream_size)
+
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "concurrency": args.concurrency, "duration": args.duration, "mix": args.mix,
+            "batch_size": args.batch_size, "stream_size": args.stream_size,
+            "junctions": len(junction_ids),
+        },
+        "results": {},
+    }
+    targets = ("inproc", "uvicorn") if args.target == "both" else (args.target,)
+    for target in targets:
+        runner = bench_inproc if target == "inproc" else bench_uvicorn
+        report["results"][target] = asyncio.run(runner(workload, args))
+
+    print_results(report)
+    output = args.output or os.path.join(HERE, "bench_results", f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Prediction cache keyed by junction and phase window.
+
+A prediction stays valid until the phase it reports ends, so each junction
+keeps the window it was last seen in: any timestamp inside [start, end)
+is answered from the entry. Entries are dropped once their window has
+passed on the wall clock, or earliest-ending first when the cache is full.
+
+Entries also record the junction's state version (see shared_state) at the
+time they were computed. A lookup with a newer version misses, so a plan or
+density written by another worker invalidates this worker's entry too.
+"""
+import heapq
+import time
+
+
+class PhaseWindowCache:
+    def __init__(self, max_entries=100_000, clock=time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = {}  # junction_id -> (start, end, status, cycle_time, version)
+        self._expiry = []  # (end, junction_id); stale pairs are skipped lazily
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, junction_id, timestamp, version=0):
+        entry = self._entries.get(junction_id)
+        if entry is not None and entry[4] != version:
+            # The junction's state changed since; the heap entry is skipped later
+            del self._entries[junction_id]
+            self.invalidations += 1
+            entry = None
+        if entry is not None and entry[0] <= timestamp < entry[1]:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, junction_id, start, end, status, cycle_time, version=0):
+        self._evict(self.clock())
+        while len(self._entries) >= self.max_entries and self._expiry:
+            self._pop_earliest()
+        self._entries[junction_id] = (start, end, status, cycle_time, version)
+        heapq.heappush(self._expiry, (end, junction_id))
+
+    def clear(self):
+        self._entries.clear()
+        self._expiry.clear()
+
+    def discard(self, junction_id):
+        # The heap entry goes stale and is skipped when it falls due
+        self._entries.pop(junction_id, None)
+
+    def _pop_earliest(self):
+        end, junction_id = heapq.heappop(self._expiry)
+        entry = self._entries.get(junction_id)
+        if entry is not None and entry[1] == end:
+            del self._entries[junction_id]
+            self.evictions += 1
+
+    def _evict(self, now):
+        while self._expiry and self._expiry[0][0] <= now:
+            self._pop_earliest()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+def window_etag(junction_id, status, end):
+    # Weak: the body's seconds_to_change ticks down inside one window
+    return f'W/"{junction_id}:{status}:{int(end * 10)}"'
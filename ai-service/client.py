@@ -0,0 +1,229 @@
+"""
+Python client for the prediction service.
+
+One client keeps a pool of keep-alive connections open. Concurrent
+predict() calls are coalesced into /predict/batch requests. Each answer is
+cached locally until its phase ends, so repeated questions about the same
+junction are served without a round trip. Requests that run past the
+recent p95 latency are hedged with a duplicate. Transport errors and 5xx
+responses are retried with exponential backoff. Every call is a read, so
+duplicates and retries are safe.
+
+    async with PredictionClient("http://127.0.0.1:8000") as client:
+        prediction = await client.predict("J1")
+        batch = await client.predict_many(["J1", "J2"], [time.time()])
+"""
+import asyncio
+import collections
+import time
+
+import httpx
+import numpy as np
+
+from phases import STATUS_LABELS
+from wire import JSON, STRUCT, unpack_columns
+
+
+class PredictionClient:
+    def __init__(self, base_url="http://127.0.0.1:8000", window=0.002, max_batch_size=512,
+                 hedge_after=0.05, hedge_quantile=0.95, retries=2, backoff=0.05, timeout=2.0,
+                 max_connections=32, cache=True, transport=None):
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections, keepalive_expiry=60),
+            # Compact columns when the server speaks them, JSON otherwise
+            headers={"accept": f"{STRUCT}, {JSON};q=0.5"},
+            transport=transport,
+        )
+        self.window = window
+        self.max_batch_size = max_batch_size
+        # Hedge once a request outlives the recent latency quantile, but never sooner than hedge_after
+        self.hedge_after = hedge_after
+        self.hedge_quantile = hedge_quantile
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+
+        self._latencies = collections.deque(maxlen=256)
+        # junction_id -> (window start, window end, status, cycle_time) in wall-clock seconds
+        self._windows = {}
+        self._pending = []
+        self._flush_handle = None
+        self._tasks = set()
+
+        self.calls = 0
+        self.cache_hits = 0
+        self.batches = 0
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retried = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.http.aclose()
+
+    async def predict(self, junction_id, timestamp=None):
+        """Phase of one junction at `timestamp` (default: now), batched with concurrent calls."""
+        timestamp = time.time() if timestamp is None else float(timestamp)
+        self.calls += 1
+        hit = self._cached(junction_id, timestamp)
+        if hit is not None:
+            self.cache_hits += 1
+            return hit
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((junction_id, timestamp, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    async def predict_many(self, junction_ids, timestamps=None):
+        """One /predict/batch round trip; `timestamps` has one entry per junction or a single shared one."""
+        if timestamps is None:
+            timestamps = [time.time()]
+        response = await self._post("/predict/batch", {
+            "junction_ids": list(junction_ids), "timestamps": [float(t) for t in timestamps],
+        })
+        if response.headers.get("content-type", "").startswith(STRUCT):
+            _, columns = unpack_columns(response.content)
+            statuses = STATUS_LABELS[columns["status"]].tolist()
+            to_change = np.round(columns["seconds_to_change"].astype(np.float64), 1).tolist()
+            cycles = columns["cycle_time"].tolist()
+        else:
+            body = response.json()
+            statuses, to_change, cycles = body["current_status"], body["seconds_to_change"], body["cycle_time"]
+
+        shared = timestamps[0] if len(timestamps) == 1 else None
+        results = []
+        for i, junction_id in enumerate(junction_ids):
+            start = timestamps[i] if shared is None else shared
+            if self.cache:
+                self._windows[junction_id] = (start, start + to_change[i], statuses[i], cycles[i])
+            results.append({
+                "junction_id": junction_id,
+                "current_status": statuses[i],
+                "seconds_to_change": to_change[i],
+                "cycle_time": cycles[i],
+            })
+        return results
+
+    def _cached(self, junction_id, timestamp):
+        window = self._windows.get(junction_id) if self.cache else None
+        if window is None:
+            return None
+        start, end, status, cycle_time = window
+        if not start <= timestamp < end:
+            return None
+        return {
+            "junction_id": junction_id,
+            "current_status": status,
+            "seconds_to_change": round(end - timestamp, 1),
+            "cycle_time": cycle_time,
+        }
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.batches += 1
+        task = asyncio.ensure_future(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        try:
+            results = await self.predict_many(
+                [junction_id for junction_id, _, _ in batch], [timestamp for _, timestamp, _ in batch]
+            )
+        except Exception as exc:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _post(self, path, payload):
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self._hedged(path, payload)
+                response.raise_for_status()
+                return response
+            except (httpx.TransportError, httpx.HTTPStatusError) as exc:
+                # 4xx means the request itself is wrong; retrying will not help
+                if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code < 500:
+                    raise
+                if attempt == self.retries:
+                    raise
+            self.retried += 1
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    def _hedge_delay(self):
+        if len(self._latencies) < 32:
+            return self.hedge_after
+        return max(self.hedge_after, float(np.quantile(self._latencies, self.hedge_quantile)))
+
+    async def _timed_post(self, path, payload):
+        start = time.perf_counter()
+        response = await self.http.post(path, json=payload)
+        self._latencies.append(time.perf_counter() - start)
+        return response
+
+    async def _hedged(self, path, payload):
+        self.requests += 1
+        first = asyncio.ensure_future(self._timed_post(path, payload))
+        if self.hedge_after is None:
+            return await first
+        done, _ = await asyncio.wait({first}, timeout=self._hedge_delay())
+        if done:
+            return first.result()
+
+        self.hedges += 1
+        self.requests += 1
+        hedge = asyncio.ensure_future(self._timed_post(path, payload))
+        pending = {first, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.hedge_wins += task is hedge
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "cached_windows": len(self._windows),
+            "batches": self.batches,
+            "mean_batch_size": (self.calls - self.cache_hits) / self.batches if self.batches else 0.0,
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "retries": self.retried,
+            "hedge_delay_ms": 1000 * self._hedge_delay() if self.hedge_after is not None else None,
+        }
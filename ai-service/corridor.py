@@ -0,0 +1,242 @@
+"""
+Green-wave speed planning along a corridor of consecutive junctions.
+
+calculate_advisory only looks at the next signal, so catching one green
+can still mean stopping at the one after it. Here the whole route is
+planned at once by dynamic programming over arrival times discretized to
+`step` seconds:
+
+- leaving junction k-1 at bin d, the vehicle can reach junction k at any
+  bin b with segment_k / (b - d) inside [MIN_SPEED, MAX_SPEED];
+- arriving in green it passes straight through, otherwise it stops (one
+  stop counted) and leaves when the next green starts;
+- the plan minimizes stops, then the arrival time at the last junction.
+
+Each step is a sliding-window minimum over the departure costs, taken as
+one vectorized pass per feasible travel time, so a corridor costs
+O(junctions * bins * window) NumPy work in O(bins) memory.
+
+Plans are cached from the first junction on, keyed by corridor, plan rows
+and the arrival bucket at that junction. The approach leg is chosen per
+request (the earliest arrival in green within the speed limits, else the
+fastest), so vehicles reaching the corridor in the same green share one
+plan regardless of where they started.
+"""
+import collections
+import time
+
+import numpy as np
+
+from advisory import MAX_SPEED, MIN_SPEED
+from phases import AMBER, GREEN, RED
+
+STEP = 1.0  # seconds per arrival-time bin
+MAX_HORIZON = 3600.0  # seconds
+
+
+def plan_corridor(plans, segments, departure, step=STEP, min_speed=MIN_SPEED, max_speed=MAX_SPEED):
+    """Plan a drive through the junctions of `plans`, in order.
+
+    segments[0] is the distance from the vehicle to the first junction and
+    segments[k] the distance from junction k-1 to junction k, in metres.
+    Returns per-junction arrays (arrival and departure times in seconds
+    after `departure`, status on arrival, stopped flag, segment speed in m/s).
+    """
+    segments = np.asarray(segments, dtype=np.float64)
+    n = len(plans)
+    cycle = plans["cycle_time"]
+    horizon = min(MAX_HORIZON, segments.sum() / min_speed + cycle.sum())
+    bins = int(np.ceil(horizon / step)) + 1
+    times = departure + step * np.arange(bins)
+
+    # Phase of every junction at every arrival bin, and the wait for the next green
+    t = np.mod(times - plans["offset"][:, None], cycle[:, None])
+    green = plans["green"][:, None]
+    red_end = green + plans["red"][:, None]
+    status = np.where(t < green, GREEN, np.where(t < red_end, RED, AMBER)).astype(np.int8)
+    stopped = status != GREEN
+    wait_bins = np.where(stopped, np.ceil((cycle[:, None] - t) / step), 0).astype(np.intp)
+    departs = np.arange(bins) + wait_bins
+
+    lo = np.ceil(segments / max_speed / step).astype(np.intp)
+    hi = np.maximum(lo, np.floor(segments / min_speed / step).astype(np.intp))
+
+    depart_cost = np.full(bins, np.inf)
+    depart_cost[0] = 0.0
+    arrive_parents, depart_parents = [], []
+    for k in range(n):
+        # Arrival bin b can come from any departure in [b - hi, b - lo]
+        if lo[k] >= bins:
+            raise ValueError("corridor cannot be driven within the planning horizon")
+        arrive_cost = np.full(bins, np.inf)
+        parent = np.full(bins, -1, dtype=np.intp)
+        for travel in range(lo[k], min(hi[k], bins - 1) + 1):
+            candidate = depart_cost[:bins - travel]
+            better = candidate < arrive_cost[travel:]
+            arrive_cost[travel:][better] = candidate[better]
+            parent[travel:][better] = np.flatnonzero(better)
+        arrive_cost += stopped[k]
+        arrive_parents.append(parent)
+
+        if k == n - 1:
+            break
+        # Several arrivals in red share one departure at the start of green: keep the cheapest
+        valid = np.flatnonzero(np.isfinite(arrive_cost) & (departs[k] < bins))
+        order = valid[np.lexsort((valid, arrive_cost[valid]))]
+        leave, first = np.unique(departs[k][order], return_index=True)
+        depart_cost = np.full(bins, np.inf)
+        depart_cost[leave] = arrive_cost[order[first]]
+        parent = np.full(bins, -1, dtype=np.intp)
+        parent[leave] = order[first]
+        depart_parents.append(parent)
+
+    if not np.isfinite(arrive_cost).any():
+        raise ValueError("corridor cannot be driven within the planning horizon")
+
+    arrivals = np.empty(n, dtype=np.intp)
+    arrivals[-1] = int(np.argmin(arrive_cost))
+    for k in range(n - 1, 0, -1):
+        arrivals[k - 1] = depart_parents[k - 1][arrive_parents[k][arrivals[k]]]
+
+    idx = np.arange(n)
+    leaves = np.minimum(departs[idx, arrivals], bins - 1)
+    previous = np.concatenate([[0], leaves[:-1]])
+    travel = (arrivals - previous) * step
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(travel > 0, segments / travel, 0.0)
+    return {
+        "arrival": arrivals * step,
+        "departure": leaves * step,
+        "status": status[idx, arrivals],
+        "stopped": stopped[idx, arrivals],
+        "speed": speed,
+    }
+
+
+def approach_arrival(plan, distance, departure, min_speed=MIN_SPEED, max_speed=MAX_SPEED):
+    """Earliest arrival at a junction `distance` metres away that lands in green, else the fastest one."""
+    earliest = departure + distance / max_speed
+    latest = departure + distance / min_speed
+    cycle, green = float(plan["cycle_time"]), float(plan["green"])
+    t = (earliest - float(plan["offset"])) % cycle
+    if t < green:
+        return earliest
+    next_green = earliest + cycle - t
+    return next_green if next_green <= latest else earliest
+
+
+class CorridorPlanCache:
+    """LRU of corridor plans keyed by junction ids, plan rows and arrival bucket at the first junction."""
+
+    def __init__(self, max_entries=10_000, bucket=1.0, distance_bucket=10.0):
+        self.max_entries = max_entries
+        self.bucket = bucket
+        self.distance_bucket = distance_bucket
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def plan(self, junction_ids, plans, segments, departure):
+        """Plan the drive leaving at `departure`; times are seconds after `departure`.
+
+        segments[0] is the approach to the first junction, driven per request;
+        the rest of the corridor comes from the cache.
+        """
+        segments = np.asarray(segments, dtype=np.float64)
+        arrival = approach_arrival(plans[0], segments[0], departure)
+        # Arrive on a bucket boundary so the cached plan is exact for this vehicle;
+        # round down only when rounding up would fall below the minimum speed
+        first = np.ceil(arrival / self.bucket) * self.bucket
+        earlier = first - self.bucket
+        if first > departure + segments[0] / MIN_SPEED and earlier >= departure:
+            first = earlier
+
+        legs = segments.copy()
+        legs[0] = 0.0
+        # Plan rows are part of the key, so re-estimated or swapped plans never hit stale entries
+        key = (tuple(junction_ids), plans.tobytes(),
+               np.round(legs[1:] / self.distance_bucket).astype(np.int64).tobytes(), first)
+        result = self._entries.get(key)
+        if result is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            result = plan_corridor(plans, legs, first)
+            self._entries[key] = result
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        approach = first - departure
+        speed = result["speed"].copy()
+        speed[0] = segments[0] / approach if approach > 0 else 0.0
+        return {
+            "arrival": result["arrival"] + approach,
+            "departure": result["departure"] + approach,
+            "status": result["status"],
+            "stopped": result["stopped"],
+            "speed": speed,
+        }
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bucket_seconds": self.bucket,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def greedy_stops(plans, segments, departure, speed=MAX_SPEED):
+    """Stops for a driver who always drives at `speed` and waits out every red (baseline)."""
+    clock, stops = departure, 0
+    for plan, distance in zip(plans, np.asarray(segments, dtype=np.float64).tolist()):
+        cycle, green, offset = float(plan["cycle_time"]), float(plan["green"]), float(plan["offset"])
+        clock += distance / speed
+        t = (clock - offset) % cycle
+        if t >= green:
+            stops += 1
+            clock += cycle - t
+    return stops
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from signal_plans import load_registry
+
+    parser = argparse.ArgumentParser(description="Plan random corridors and time planning vs cache hits")
+    parser.add_argument("--length", type=int, default=8, help="junctions per corridor")
+    parser.add_argument("--segment", type=float, default=400.0, help="metres between junctions")
+    parser.add_argument("--corridors", type=int, default=200)
+    args = parser.parse_args()
+
+    registry = load_registry()
+    rng = np.random.default_rng(0)
+    cache = CorridorPlanCache()
+    now = time.time()
+    plan_time, stops, baseline = 0.0, 0, 0
+    for _ in range(args.corridors):
+        plans = registry.plans[:-1][rng.integers(0, len(registry.ids), args.length)].copy()
+        plans["offset"] = rng.uniform(0, plans["cycle_time"])
+        segments = np.full(args.length, args.segment)
+        start = time.perf_counter()
+        result = cache.plan([str(i) for i in range(args.length)], plans, segments, now)
+        plan_time += time.perf_counter() - start
+        stops += int(result["stopped"].sum())
+        baseline += greedy_stops(plans, segments, now)
+        start = time.perf_counter()
+        cache.plan([str(i) for i in range(args.length)], plans, segments, now)
+        hit_time = time.perf_counter() - start
+    print(f"plan {1e3 * plan_time / args.corridors:.2f} ms/corridor, cache hit {1e6 * hit_time:.1f} us")
+    print(f"stops per corridor: planned {stops / args.corridors:.2f}, "
+          f"max-speed baseline {baseline / args.corridors:.2f}")
@@ -0,0 +1,162 @@
+"""
+Queue density cache and density-aware phase adjustment.
+
+Densities (0 = empty approach, 1 = fully queued) are kept in flat arrays
+indexed by registry row together with an expiry time. Adaptive controllers
+hold green while a queue is still discharging and call the next phase early
+while a waiting queue builds up, so a sample moves one phase boundary: the
+end of the phase in progress when the sample arrives. The boundary is fixed
+at ingest (scheduled window, shifted end, end of the following phase) and
+predictions derive both status and seconds to change from it until the
+sample expires. Expired or never-reported junctions follow the plan. The
+arrays never grow, so eviction is just the expiry check; expire() clears
+lapsed samples so callers can invalidate what was derived from them.
+"""
+import time
+
+import numpy as np
+
+from phases import GREEN, RED, phase_windows
+from shared_state import allocate
+
+DEFAULT_TTL = 30.0  # seconds a density sample stays usable
+
+GREEN_GAIN = 0.5
+RED_GAIN = 0.3
+MAX_EXTENSION = 15.0  # seconds
+
+# Per-junction state, as (name, dtype, item shape, initial value)
+STATE_FIELDS = (
+    ("density", np.float32, (), 0.0),
+    ("density_expires", np.float64, (), 0.0),
+    # Phase in progress when the sample arrived: status, scheduled start and
+    # end, the shifted end, and the scheduled end of the phase after it
+    ("density_status", np.int8, (), -1),
+    ("density_start", np.float64, (), np.nan),
+    ("density_end", np.float64, (), np.nan),
+    ("density_shifted_end", np.float64, (), np.nan),
+    ("density_next_end", np.float64, (), np.nan),
+)
+
+
+def boundary_shift(status, seconds_to_change, density,
+                   green_gain=GREEN_GAIN, red_gain=RED_GAIN, max_extension=MAX_EXTENSION):
+    """Seconds the end of the phase in progress moves: later in green, earlier in red."""
+    density = np.nan_to_num(np.asarray(density, dtype=np.float64), nan=0.0)
+    remaining = np.asarray(seconds_to_change, dtype=np.float64)
+    extension = np.minimum(remaining * green_gain * density, max_extension)
+    return np.where(status == GREEN, extension, np.where(status == RED, -remaining * red_gain * density, 0.0))
+
+
+class DensityCache:
+    def __init__(self, size, ttl=DEFAULT_TTL, clock=time.time, state=None):
+        self.ttl = ttl
+        self.clock = clock
+        # One spare slot so unknown junctions (row -1) always read as expired
+        state = state or allocate(STATE_FIELDS, size + 1)
+        self.density = state["density"]
+        self.expires = state["density_expires"]
+        self.status = state["density_status"]
+        self.start = state["density_start"]
+        self.end = state["density_end"]
+        self.shifted_end = state["density_shifted_end"]
+        self.next_end = state["density_next_end"]
+
+    def update(self, rows, densities, plans, now=None):
+        """Store the latest density per row and fix its phase boundary; duplicates keep the highest value.
+
+        `plans` is the registry's plan array, indexed by row.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        densities = np.clip(np.asarray(densities, dtype=np.float32), 0.0, 1.0)
+        known = rows >= 0
+        rows, densities = rows[known], densities[known]
+        now = self.clock() if now is None else now
+
+        # The worst approach reported in this batch drives the junction value
+        unique_rows = np.unique(rows)
+        self.density[unique_rows] = 0.0
+        np.maximum.at(self.density, rows, densities)
+        self.expires[unique_rows] = now + self.ttl
+
+        p = plans[unique_rows]
+        status, start, end = phase_windows(
+            np.full(len(unique_rows), now, dtype=np.float64), 2,
+            p["cycle_time"], p["green"], p["red"], p["offset"],
+        )
+        self.status[unique_rows] = status[:, 0]
+        self.start[unique_rows] = start[:, 0]
+        self.end[unique_rows] = end[:, 0]
+        self.shifted_end[unique_rows] = end[:, 0] + boundary_shift(
+            status[:, 0], end[:, 0] - now, self.density[unique_rows])
+        self.next_end[unique_rows] = end[:, 1]
+        return unique_rows
+
+    def boundaries(self, rows, now=None):
+        """Live phase boundaries for `rows`; status is -1 where no sample is live."""
+        now = self.clock() if now is None else now
+        status = self.status[rows].copy()
+        status[self.expires[rows] <= now] = -1
+        return {
+            "status": status,
+            "start": self.start[rows],
+            "end": self.end[rows],
+            "shifted_end": self.shifted_end[rows],
+            "next_end": self.next_end[rows],
+        }
+
+    def expired(self, now=None):
+        """True if some sample has lapsed since the last expire()."""
+        now = self.clock() if now is None else now
+        return bool(np.any((self.status >= 0) & (self.expires <= now)))
+
+    def expire(self, now=None):
+        """Clear lapsed samples; returns their rows. Call under the state writer lock."""
+        now = self.clock() if now is None else now
+        rows = np.flatnonzero((self.status >= 0) & (self.expires <= now))
+        self.status[rows] = -1
+        return rows
+
+    def live_count(self, now=None):
+        now = self.clock() if now is None else now
+        return int(np.count_nonzero(self.expires[:-1] > now))
+
+
+def apply_boundaries(timestamps, status, seconds_to_change, boundaries):
+    """Status and seconds to change with each live boundary applied.
+
+    Between the start of the sampled phase and its shifted end the sampled
+    phase holds; when the end moved earlier, the following phase runs from
+    the shifted end to its own scheduled end. Elsewhere the plan applies.
+    """
+    t = np.asarray(timestamps, dtype=np.float64)
+    sampled = boundaries["status"]
+    live = sampled >= 0
+    shifted = boundaries["shifted_end"]
+    current = live & (t >= boundaries["start"]) & (t < shifted)
+    following = live & ~current & (t >= shifted) & (t < boundaries["end"])
+    status = np.where(current, sampled, np.where(following, (sampled + 1) % 3, status)).astype(np.int8)
+    to_change = np.where(current, shifted - t,
+                         np.where(following, boundaries["next_end"] - t, seconds_to_change))
+    return status, to_change
+
+
+def boundary_windows(timestamps, count, plans, boundaries):
+    """phase_windows with each live boundary applied: the phase in progress and `count - 1` after it."""
+    t = np.asarray(timestamps, dtype=np.float64)
+    live = (boundaries["status"] >= 0) & (t < np.maximum(boundaries["shifted_end"], boundaries["end"]))
+    # Start from inside the sampled window when the query falls in its extension
+    origin = np.where(live, np.minimum(t, boundaries["start"] + 1e-3), t)
+    status, start, end = phase_windows(
+        origin, count + 2, plans["cycle_time"], plans["green"], plans["red"], plans["offset"]
+    )
+    sampled = live[:, None] & (np.abs(start - boundaries["start"][:, None]) < 1e-3)
+    shifted = np.broadcast_to(boundaries["shifted_end"][:, None], end.shape)
+    end = np.where(sampled, shifted, end)
+    start[:, 1:] = np.where(sampled[:, :-1], shifted[:, :-1], start[:, 1:])
+
+    # A shortened sampled phase may already have ended; windows start at the one in progress
+    skip = np.minimum(np.count_nonzero(end <= t[:, None], axis=1), 2)
+    take = skip[:, None] + np.arange(count)
+    return tuple(np.take_along_axis(a, take, axis=1) for a in (status, start, end))
+
@@ -0,0 +1,84 @@
+"""
+Asyncio micro-batching in front of the batch predictor.
+
+Single requests are queued and flushed together as one batch once the
+collection window expires or the batch is full, then each waiting caller
+gets its own result back. The predictor runs once per batch, so per-call
+inference cost is amortized across everything that arrived in the window.
+"""
+import asyncio
+import time
+
+
+class MicroBatcher:
+    def __init__(self, predict_batch, window=0.002, max_batch_size=256):
+        # predict_batch(items) -> list of results in the same order
+        self.predict_batch = predict_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._flush_handle = None
+
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.last_batch_size = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        now = time.perf_counter()
+        waits = [now - enqueued for _, _, enqueued in batch]
+        self.batches += 1
+        self.items += len(batch)
+        self.last_batch_size = len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.total_wait += sum(waits)
+        self.max_wait = max(self.max_wait, max(waits))
+
+        try:
+            results = self.predict_batch([item for item, _, _ in batch])
+        except Exception as exc:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future, _), result in zip(batch, results):
+            # Callers that gave up (client disconnect) leave a cancelled future
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_seen": self.max_batch_seen,
+            "mean_wait_ms": 1000 * self.total_wait / self.items if self.items else 0.0,
+            "max_wait_ms": 1000 * self.max_wait,
+        }
@@ -0,0 +1,285 @@
+"""
+Instantaneous fuel and emissions over vehicle trajectories.
+
+Each sample (speed, acceleration, road grade) is turned into vehicle
+specific power, following Jimenez-Palacios:
+
+    VSP = v * (rotational * a + g * grade + g * rolling) + aero * v^3   [kW/t]
+
+and tractive power VSP * mass. The fuel rate is the class idle rate plus a
+linear term in positive tractive power (decelerating runs at idle fuel).
+CO2 follows from the fuel's carbon content, and PM2.5 and NOx from
+fuel-based emission factors.
+
+Class parameters cover the Indian urban fleet: 2W (110-125 cc petrol),
+3W (CNG autos), CAR (petrol hatchback) and LCV (diesel). They are
+indicative defaults sized from typical on-road fuel economy and per-km
+emission factors. Use load_class_table() to supply locally calibrated
+values.
+
+Everything is vectorized over samples. FleetEmissions consumes
+trajectories chunk by chunk and keeps only per-vehicle totals plus each
+vehicle's last sample, so memory does not grow with the length of the
+input:
+
+    python emissions.py trajectories.csv --chunk-rows 1000000
+    python emissions.py --simulate --vehicles 20000
+
+The CSV holds vehicle_id, vehicle_class, timestamp, speed (m/s) and,
+optionally, acceleration (m/s^2) and grade; rows of one vehicle must be in
+time order. Without acceleration it is derived from successive speeds.
+"""
+import argparse
+import csv
+import itertools
+import json
+
+import numpy as np
+
+GRAVITY = 9.81  # m/s^2
+
+CLASS_DTYPE = np.dtype([
+    ("name", "U8"),
+    ("mass", "f8"),  # tonnes, loaded
+    ("rotational", "f8"),  # mass factor for rotating parts
+    ("rolling", "f8"),  # rolling resistance coefficient
+    ("aero", "f8"),  # 0.5 * rho * Cd * A / mass, kW/t per (m/s)^3
+    ("idle_fuel", "f8"),  # g/s
+    ("fuel_per_kw", "f8"),  # g/s per kW of positive tractive power
+    ("co2_per_fuel", "f8"),  # g/g
+    ("pm25_per_fuel", "f8"),  # g/kg
+    ("nox_per_fuel", "f8"),  # g/kg
+])
+
+DEFAULT_CLASSES = np.array([
+    ("2W", 0.18, 1.10, 0.020, 0.0020, 0.02, 0.16, 3.17, 0.90, 13.0),
+    ("3W", 0.70, 1.10, 0.015, 0.0010, 0.06, 0.17, 2.75, 0.30, 9.0),
+    ("CAR", 1.20, 1.10, 0.0135, 0.000302, 0.20, 0.15, 3.17, 0.04, 1.2),
+    ("LCV", 3.00, 1.10, 0.010, 0.0006, 0.30, 0.15, 3.16, 0.48, 5.7),
+], dtype=CLASS_DTYPE)
+
+POLLUTANTS = ("fuel", "co2", "pm25", "nox")
+
+
+def load_class_table(path):
+    """Read a JSON list of class records with the CLASS_DTYPE fields."""
+    with open(path) as f:
+        records = json.load(f)
+    return np.array([tuple(r[name] for name in CLASS_DTYPE.names) for r in records], dtype=CLASS_DTYPE)
+
+
+def class_codes(names, table=DEFAULT_CLASSES):
+    """Map class names (e.g. "2W") to rows of `table`."""
+    lookup = {name: i for i, name in enumerate(table["name"].tolist())}
+    uniq, inverse = np.unique(np.asarray(names, dtype=str), return_inverse=True)
+    try:
+        codes = np.array([lookup[name.upper()] for name in uniq.tolist()], dtype=np.intp)
+    except KeyError as exc:
+        raise ValueError(f"unknown vehicle class {exc.args[0]}; expected one of {', '.join(lookup)}")
+    return codes[inverse]
+
+
+def vehicle_specific_power(speed, accel, grade, params):
+    return speed * (params["rotational"] * accel + GRAVITY * grade + GRAVITY * params["rolling"]) \
+        + params["aero"] * speed ** 3
+
+
+def emission_rates(classes, speed, accel, grade=0.0, table=DEFAULT_CLASSES):
+    """Instantaneous rates in g/s for every sample: {"fuel", "co2", "pm25", "nox", "vsp"}."""
+    params = table[np.asarray(classes, dtype=np.intp)]
+    speed = np.asarray(speed, dtype=np.float64)
+    vsp = vehicle_specific_power(speed, np.asarray(accel, dtype=np.float64), grade, params)
+    power = np.maximum(vsp * params["mass"], 0.0)
+    fuel = params["idle_fuel"] + params["fuel_per_kw"] * power
+    return {
+        "fuel": fuel,
+        "co2": fuel * params["co2_per_fuel"],
+        "pm25": fuel * params["pm25_per_fuel"] / 1000,
+        "nox": fuel * params["nox_per_fuel"] / 1000,
+        "vsp": vsp,
+    }
+
+
+class FleetEmissions:
+    """Streaming per-vehicle totals of fuel, emissions, distance and time."""
+
+    def __init__(self, table=DEFAULT_CLASSES):
+        self.table = table
+        self.index = {}  # vehicle id -> dense row
+        self.vehicle_class = np.zeros(0, dtype=np.intp)
+        self.last_time = np.zeros(0)
+        self.last_speed = np.zeros(0)
+        self.totals = {name: np.zeros(0) for name in POLLUTANTS + ("distance", "time")}
+        self.samples = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def _rows(self, vehicle_ids, classes):
+        uniq, inverse = np.unique(np.asarray(vehicle_ids), return_inverse=True)
+        rows = np.empty(len(uniq), dtype=np.intp)
+        new = []
+        for i, vehicle_id in enumerate(uniq.tolist()):
+            row = self.index.get(vehicle_id)
+            if row is None:
+                row = self.index[vehicle_id] = len(self.index)
+                new.append(i)
+            rows[i] = row
+        if new:
+            grow = len(self.index) - len(self.vehicle_class)
+            self.vehicle_class = np.concatenate([self.vehicle_class, np.zeros(grow, dtype=np.intp)])
+            self.last_time = np.concatenate([self.last_time, np.full(grow, np.nan)])
+            self.last_speed = np.concatenate([self.last_speed, np.zeros(grow)])
+            for name, column in self.totals.items():
+                self.totals[name] = np.concatenate([column, np.zeros(grow)])
+        rows = rows[inverse]
+        self.vehicle_class[rows] = classes
+        return rows
+
+    def update(self, vehicle_ids, classes, timestamps, speed, accel=None, grade=0.0):
+        """Add one chunk of samples; `classes` are rows of the class table."""
+        rows = self._rows(vehicle_ids, classes)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        speed = np.asarray(speed, dtype=np.float64)
+        order = np.lexsort((timestamps, rows))
+        rows, timestamps, speed = rows[order], timestamps[order], speed[order]
+        if accel is not None:
+            accel = np.asarray(accel, dtype=np.float64)[order]
+        grade = np.broadcast_to(np.asarray(grade, dtype=np.float64), order.shape)[order]
+        # Samples not newer than a vehicle's carried last sample (out of order across chunks) are dropped
+        fresh = ~(timestamps <= self.last_time[rows])
+        if not fresh.all():
+            rows, timestamps, speed, grade = rows[fresh], timestamps[fresh], speed[fresh], grade[fresh]
+            if accel is not None:
+                accel = accel[fresh]
+
+        # The previous sample is the one before in this chunk, or the carried last sample
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+        prev_time = np.where(first, self.last_time[rows], np.roll(timestamps, 1))
+        prev_speed = np.where(first, self.last_speed[rows], np.roll(speed, 1))
+        dt = timestamps - prev_time
+        # A vehicle's first ever sample only sets the starting point
+        dt = np.where(np.isnan(dt), 0.0, np.maximum(dt, 0.0))
+        if accel is None:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                accel = np.where(dt > 0, (speed - prev_speed) / dt, 0.0)
+
+        rates = emission_rates(self.vehicle_class[rows], speed, accel, grade, self.table)
+        n = len(self.index)
+        for name in POLLUTANTS:
+            self.totals[name] += np.bincount(rows, rates[name] * dt, minlength=n)
+        self.totals["distance"] += np.bincount(rows, 0.5 * (speed + prev_speed) * dt, minlength=n)
+        self.totals["time"] += np.bincount(rows, dt, minlength=n)
+
+        last = np.ones(len(rows), dtype=bool)
+        last[:-1] = rows[:-1] != rows[1:]
+        self.last_time[rows[last]] = timestamps[last]
+        self.last_speed[rows[last]] = speed[last]
+        self.samples += len(rows)
+
+    def by_class(self):
+        """Fleet totals per class: grams of each pollutant, km driven and g/km."""
+        report = {}
+        for code, name in enumerate(self.table["name"].tolist()):
+            mask = self.vehicle_class == code
+            if not mask.any():
+                continue
+            km = self.totals["distance"][mask].sum() / 1000
+            entry = {"vehicles": int(mask.sum()), "km": float(km), "hours": float(self.totals["time"][mask].sum() / 3600)}
+            for pollutant in POLLUTANTS:
+                grams = float(self.totals[pollutant][mask].sum())
+                entry[f"{pollutant}_g"] = grams
+                entry[f"{pollutant}_g_per_km"] = grams / km if km else 0.0
+            report[name] = entry
+        return report
+
+    def simulation_observer(self, classes, dt):
+        """Observer for simulate.Simulator: `classes` holds each simulated vehicle's class row."""
+        def observe(t, idx, speed, accel):
+            rows = self._rows(idx, classes[idx])
+            rates = emission_rates(classes[idx], speed, accel, 0.0, self.table)
+            n = len(self.index)
+            for name in POLLUTANTS:
+                self.totals[name] += np.bincount(rows, rates[name] * dt, minlength=n)
+            self.totals["distance"] += np.bincount(rows, speed * dt, minlength=n)
+            self.totals["time"] += np.bincount(rows, np.full(len(rows), dt), minlength=n)
+            self.samples += len(rows)
+        return observe
+
+
+def read_trajectory_chunks(path, chunk_rows=1_000_000, table=DEFAULT_CLASSES):
+    """Yield (vehicle_ids, classes, timestamps, speed, accel or None, grade) per chunk of rows."""
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        has_accel = "acceleration" in reader.fieldnames
+        has_grade = "grade" in reader.fieldnames
+        while True:
+            rows = list(itertools.islice(reader, chunk_rows))
+            if not rows:
+                return
+            yield (
+                np.array([r["vehicle_id"] for r in rows]),
+                class_codes([r["vehicle_class"] for r in rows], table),
+                np.array([r["timestamp"] for r in rows], dtype=np.float64),
+                np.array([r["speed"] for r in rows], dtype=np.float64),
+                np.array([r["acceleration"] for r in rows], dtype=np.float64) if has_accel else None,
+                np.array([r["grade"] for r in rows], dtype=np.float64) if has_grade else 0.0,
+            )
+
+
+def simulate_fleet(args, table):
+    from simulate import STEP, Network, Simulator
+
+    mix = np.array([float(x) for x in args.mix.split(",")])
+    network = Network.synthetic(args.routes, args.junctions, args.seed)
+    classes = np.random.default_rng(args.seed).choice(len(table), args.vehicles, p=mix / mix.sum())
+    reports = {}
+    for policy in ("none", "glosa"):
+        fleet = FleetEmissions(table)
+        sim = Simulator(network, args.vehicles, args.duration * 2 / 3, policy, seed=args.seed)
+        sim.observers.append(fleet.simulation_observer(classes, STEP))
+        sim.run(args.duration)
+        reports[policy] = fleet.by_class()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuel and emissions over vehicle trajectories.")
+    parser.add_argument("trajectories", nargs="?", help="CSV of trajectory samples")
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000)
+    parser.add_argument("--classes", help="JSON class table replacing the defaults")
+    parser.add_argument("--simulate", action="store_true",
+                        help="compare simulated fleets with and without GLOSA instead of reading a CSV")
+    parser.add_argument("--vehicles", type=int, default=20000)
+    parser.add_argument("--routes", type=int, default=400)
+    parser.add_argument("--junctions", type=int, default=6)
+    parser.add_argument("--duration", type=float, default=1800.0)
+    parser.add_argument("--mix", default="0.6,0.1,0.25,0.05", help="fleet shares of 2W,3W,CAR,LCV")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    table = load_class_table(args.classes) if args.classes else DEFAULT_CLASSES
+    if args.simulate:
+        reports = simulate_fleet(args, table)
+        print(f"{'class':<5} {'fuel g/km':>18} {'CO2 g/km':>18} {'PM2.5 mg/km':>18}   (none -> glosa)")
+        for name in reports["none"]:
+            before, after = reports["none"][name], reports["glosa"][name]
+            print(f"{name:<5} {before['fuel_g_per_km']:8.1f} -> {after['fuel_g_per_km']:6.1f} "
+                  f"{before['co2_g_per_km']:8.1f} -> {after['co2_g_per_km']:6.1f} "
+                  f"{1000 * before['pm25_g_per_km']:8.2f} -> {1000 * after['pm25_g_per_km']:6.2f}")
+        fuel = {p: sum(c["fuel_g"] for c in r.values()) / sum(c["km"] for c in r.values())
+                for p, r in reports.items()}
+        print(f"fleet fuel per km: {100 * (fuel['glosa'] / fuel['none'] - 1):+.1f}% with GLOSA")
+        return
+    if not args.trajectories:
+        parser.error("give a trajectories CSV or --simulate")
+
+    fleet = FleetEmissions(table)
+    for chunk in read_trajectory_chunks(args.trajectories, args.chunk_rows, table):
+        fleet.update(*chunk)
+    print(json.dumps({"samples": fleet.samples, "vehicles": len(fleet), "classes": fleet.by_class()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Online estimation of fixed-time signal plans from observed phase changes.
+
+Each event says "junction J switched to STATUS at time t" (camera or field
+report). Per junction we keep exponentially weighted estimates of every
+phase duration, the cycle length (between GREEN onsets) and a smoothed
+recent GREEN onset: each onset is compared with the previous anchor carried
+forward by whole cycles, so the anchor tracks the schedule without mixing
+angles taken modulo different cycle estimates. The offset is derived from
+the anchor only when a plan is published, with the exact cycle value that is
+stored, so predictions near the present agree with the observed
+switches. An event is a handful
+of scalar updates, so thousands of junctions can drift-track their plans
+continuously without any batch retraining. Learned plans are written
+straight into the registry's plan rows, which every prediction path reads.
+"""
+import numpy as np
+
+from phases import AMBER, GREEN, RED
+from shared_state import allocate
+
+PHASES = (GREEN, RED, AMBER)
+
+# Per-junction state, as (name, dtype, item shape, initial value)
+STATE_FIELDS = (
+    ("last_status", np.int8, (), -1),
+    ("last_time", np.float64, (), np.nan),
+    ("last_green", np.float64, (), np.nan),
+    ("durations", np.float64, (3,), np.nan),
+    ("cycle", np.float64, (), np.nan),
+    ("onset", np.float64, (), np.nan),
+    ("cycles_seen", np.int32, (), 0),
+)
+
+
+class PlanEstimator:
+    def __init__(self, registry, alpha=0.2, min_cycles=2, max_phase=300.0, state=None):
+        self.registry = registry
+        self.alpha = alpha
+        # Plans are only published after this many complete cycles
+        self.min_cycles = min_cycles
+        self.max_phase = max_phase
+
+        state = state or allocate(STATE_FIELDS, len(registry))
+        self.last_status = state["last_status"]
+        self.last_time = state["last_time"]
+        self.last_green = state["last_green"]
+        self.durations = state["durations"]
+        self.cycle = state["cycle"]
+        self.onset = state["onset"]
+        self.cycles_seen = state["cycles_seen"]
+
+        self.accepted = 0
+        self.rejected = 0
+
+    def _smooth(self, previous, value):
+        return value if np.isnan(previous) else previous + self.alpha * (value - previous)
+
+    def observe(self, row, status, timestamp):
+        """Ingest one phase-change event; returns True if the plan was republished."""
+        if row < 0 or status not in PHASES:
+            self.rejected += 1
+            return False
+        last_time = self.last_time[row]
+        if timestamp <= last_time:
+            # Out of order or duplicate report
+            self.rejected += 1
+            return False
+        self.accepted += 1
+
+        previous = self.last_status[row]
+        if previous >= 0 and status == (previous + 1) % 3:
+            elapsed = timestamp - last_time
+            if elapsed <= self.max_phase:
+                self.durations[row, previous] = self._smooth(self.durations[row, previous], elapsed)
+        self.last_status[row] = status
+        self.last_time[row] = timestamp
+
+        if status != GREEN:
+            return False
+        published = False
+        last_green = self.last_green[row]
+        self.last_green[row] = timestamp
+        if not np.isnan(last_green):
+            interval = timestamp - last_green
+            cycle = self.cycle[row]
+            if not np.isnan(cycle):
+                # A missed report spans whole cycles; fold it back to one
+                interval /= max(round(interval / cycle), 1)
+            if interval <= 3 * self.max_phase:
+                self.cycle[row] = self._smooth(cycle, interval)
+                self.cycles_seen[row] += 1
+
+        cycle = self.cycle[row]
+        if not np.isnan(cycle):
+            onset = self.onset[row]
+            if np.isnan(onset):
+                self.onset[row] = timestamp
+            else:
+                # Carry the anchor to the cycle this onset belongs to, then smooth
+                predicted = onset + round((timestamp - onset) / cycle) * cycle
+                self.onset[row] = predicted + self.alpha * (timestamp - predicted)
+            published = self._publish(row)
+        return published
+
+    def _publish(self, row):
+        durations = self.durations[row]
+        if self.cycles_seen[row] < self.min_cycles or np.isnan(durations).any():
+            return False
+        cycle = self.cycle[row]
+        # Phase estimates drift independently; rescale them to fill the cycle
+        green, red, _ = durations * (cycle / durations.sum())
+        plan = self.registry.plans[row]
+        plan["cycle_time"] = cycle
+        plan["green"] = green
+        plan["red"] = red
+        # From the value actually stored, so the anchor lands on a cycle boundary
+        plan["offset"] = self.onset[row] % plan["cycle_time"]
+        return True
+
+    def observe_many(self, junction_ids, statuses, timestamps):
+        """Ingest events in order.
+
+        Returns the registry row of every event (-1 where it was rejected)
+        and the set of rows whose plan was republished.
+        """
+        rows = self.registry.rows(junction_ids)
+        updated = set()
+        for i, (row, status, timestamp) in enumerate(zip(rows.tolist(), statuses, timestamps)):
+            rejected = self.rejected
+            if self.observe(row, status, timestamp):
+                updated.add(row)
+            if self.rejected != rejected:
+                rows[i] = -1
+        return rows, updated
+
+    def describe(self, row):
+        return {
+            "cycles_observed": int(self.cycles_seen[row]),
+            "cycle_estimate": None if np.isnan(self.cycle[row]) else float(self.cycle[row]),
+            "phase_estimates": {
+                label: None if np.isnan(d) else float(d)
+                for label, d in zip(("GREEN", "RED", "AMBER"), self.durations[row])
+            },
+        }
@@ -0,0 +1,142 @@
+"""
+Append-only, memory-mapped ring buffers of per-junction history.
+
+Every junction owns a fixed region of 2 * capacity records in one data file.
+Each record is written twice, at slot `k % capacity` and at
+`k % capacity + capacity`, so the newest `capacity` records are always one
+contiguous slice. Range reads therefore return NumPy views straight into the
+mapping, and appends are a single scatter from the caller's array with no
+per-record Python objects. Write counters live in a separate small mapping.
+
+Range reads binary-search the timestamps, so each junction's records must
+stay in time order: append() drops a record older than the junction's
+newest one (stored or earlier in the same batch) and reports which it kept.
+
+Views alias the ring: records older than `capacity` appends are overwritten
+in place, so copy a view if it must outlive further ingest.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+PHASE_EVENT_DTYPE = np.dtype([("timestamp", "<f8"), ("status", "<i1")])
+DENSITY_DTYPE = np.dtype([("timestamp", "<f8"), ("approach", "<u1"), ("density", "<f4")])
+
+
+class RingHistory:
+    def __init__(self, path, dtype, junction_ids, capacity):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.capacity = int(capacity)
+        n = len(junction_ids)
+
+        meta = {"dtype": self.dtype.descr, "capacity": self.capacity, "junctions": list(junction_ids)}
+        meta_path = path + ".json"
+        fresh = not self._matches(meta_path, meta)
+        if fresh:
+            self._retire(meta_path)
+            with open(meta_path, "w") as f:
+                json.dump(meta, f)
+
+        mode = "w+" if fresh else "r+"
+        # np.memmap cannot map zero bytes, so an empty registry keeps one spare row
+        self.heads = np.memmap(path + ".heads", dtype="<i8", mode=mode, shape=(max(n, 1),))
+        self.data = np.memmap(path + ".data", dtype=self.dtype, mode=mode,
+                              shape=(max(n, 1), 2 * self.capacity))
+
+    @staticmethod
+    def _matches(meta_path, meta):
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path) as f:
+            stored = json.load(f)
+        stored["dtype"] = [tuple(field) for field in stored["dtype"]]
+        return stored == meta
+
+    def _retire(self, meta_path):
+        # Junction set or layout changed: keep the old files, start afresh
+        suffix = time.strftime(".%Y%m%d%H%M%S.stale")
+        for old in (meta_path, self.path + ".heads", self.path + ".data"):
+            if os.path.exists(old):
+                os.replace(old, old + suffix)
+
+    def append(self, rows, records):
+        """Append records (structured array) for the given junction rows, in order.
+
+        Returns a mask of the records kept; out-of-order ones are dropped.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        records = np.asarray(records, dtype=self.dtype)
+        kept = self.in_order(rows, records["timestamp"])
+        rows, records = rows[kept], records[kept]
+        if not len(rows):
+            return kept
+
+        # Position of each record within its junction's run in this batch
+        order = np.argsort(rows, kind="stable")
+        sorted_rows = rows[order]
+        run_start = np.r_[True, sorted_rows[1:] != sorted_rows[:-1]]
+        starts = np.flatnonzero(run_start)
+        rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+
+        seq = self.heads[sorted_rows] + rank
+        slot = seq % self.capacity
+        self.data[sorted_rows, slot] = records[order]
+        self.data[sorted_rows, slot + self.capacity] = records[order]
+        # Counters move last, so a concurrent reader never sees unwritten slots
+        self.heads[sorted_rows[starts]] += np.diff(np.r_[starts, len(rows)])
+        return kept
+
+    def in_order(self, rows, timestamps):
+        """Mask of timestamps no older than their junction's newest record or any before them in the batch."""
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        kept = np.isfinite(timestamps)
+        if not kept.any():
+            return kept
+        written = self.heads[rows]
+        newest = np.where(written > 0, self.data[rows, (written - 1) % self.capacity]["timestamp"], -np.inf)
+
+        # Running maximum per junction: runs are laid end to end by adding
+        # the run index times the batch's span, so one accumulate serves all
+        order = np.argsort(rows, kind="stable")
+        sorted_rows, ts = rows[order], np.where(kept, timestamps, -np.inf)[order]
+        run_start = np.r_[True, sorted_rows[1:] != sorted_rows[:-1]]
+        finite = ts[np.isfinite(ts)]
+        span = finite.max() - finite.min() + 1.0
+        shifted = np.maximum(ts - finite.min(), -1.0) + (np.cumsum(run_start) - 1) * span
+        before = np.r_[-np.inf, np.maximum.accumulate(shifted)[:-1]]
+        before[run_start] = -np.inf
+        in_order = np.empty_like(kept)
+        in_order[order] = shifted >= before
+        return kept & in_order & (timestamps >= newest)
+
+    def latest(self, row, count=None):
+        """View of the newest `count` records of a junction, oldest first."""
+        written = int(self.heads[row])
+        available = min(written, self.capacity)
+        count = available if count is None else min(int(count), available)
+        end = written % self.capacity + self.capacity
+        return self.data[row, end - count:end]
+
+    def between(self, row, start, end):
+        """View of the records with start <= timestamp < end."""
+        records = self.latest(row)
+        timestamps = records["timestamp"]
+        lo, hi = np.searchsorted(timestamps, [start, end])
+        return records[lo:hi]
+
+    def flush(self):
+        self.data.flush()
+        self.heads.flush()
+
+
+def open_history(directory, junction_ids, phase_capacity=4096, density_capacity=8192):
+    os.makedirs(directory, exist_ok=True)
+    return (
+        RingHistory(os.path.join(directory, "phase_events"), PHASE_EVENT_DTYPE,
+                    junction_ids, phase_capacity),
+        RingHistory(os.path.join(directory, "density"), DENSITY_DTYPE,
+                    junction_ids, density_capacity),
+    )
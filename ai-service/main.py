@@ -1,10 +1,142 @@
+import asyncio
+import json
+import os
 import random
 import time
-from fastapi import FastAPI
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from typing import List, Optional
+import numpy as np
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from datetime import datetime
 
-app = FastAPI(title="GLOSA AI Prediction Service")
+from phases import STATUS_CODES, STATUS_LABELS
+from admission import AdmissionController, AdmissionMiddleware
+from advisory import MESSAGES as ADVISORY_MESSAGES, calculate_advisory, haversine
+from cache import PhaseWindowCache, window_etag
+from density import (STATE_FIELDS as DENSITY_STATE_FIELDS, DensityCache, apply_boundaries,
+                     boundary_windows)
+from corridor import CorridorPlanCache
+from dispatcher import MicroBatcher
+from estimator import STATE_FIELDS as ESTIMATOR_STATE_FIELDS, PlanEstimator
+from history import DENSITY_DTYPE, PHASE_EVENT_DTYPE, open_history
+from metrics import Metrics, MetricsMiddleware
+from models import build_features, default_registry as default_model_registry
+from shared_state import JunctionStateTable
+from signal_plans import load_registry
+from singleflight import SingleFlight
+from routing import cached_graph, route_many, routing_pool
+from spatial import JunctionGrid
+from streaming import PhaseBroadcaster
+from wire import (ADVISORY, ADVISORY_COLUMNS, MSGPACK, PREDICTION, PREDICTION_COLUMNS, STRUCT,
+                  dumps_json, dumps_msgpack, negotiate, pack_columns)
+
+# Signal plans for every known junction, loaded once at startup
+registry = load_registry()
+
+# Phase prediction models; GLOSA_MODEL picks the one serving at startup
+models = default_model_registry()
+models.activate(os.environ.get("GLOSA_MODEL", "schedule"))
+
+# Mutable junction state (plans, densities, estimator). With GLOSA_SHARED_STATE
+# set it lives in a shared-memory segment that every uvicorn worker maps.
+state = JunctionStateTable(
+    registry, DENSITY_STATE_FIELDS + ESTIMATOR_STATE_FIELDS,
+    name=os.environ.get("GLOSA_SHARED_STATE") or None,
+)
+
+# Live queue densities from perception, expiring after GLOSA_DENSITY_TTL seconds
+densities = DensityCache(
+    len(registry), ttl=float(os.environ.get("GLOSA_DENSITY_TTL", "30")),
+    state=state.view(field for field, *_ in DENSITY_STATE_FIELDS),
+)
+
+# Learns cycle, splits and offset from observed phase changes
+plan_estimator = PlanEstimator(
+    registry, state=state.view(field for field, *_ in ESTIMATOR_STATE_FIELDS)
+)
+
+# Memory-mapped ring buffers of phase events and density samples; opened
+# under the writer lock so workers starting together agree on the files
+with state.write():
+    phase_history, density_history = open_history(
+        os.environ.get("GLOSA_HISTORY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "history")),
+        registry.ids,
+    )
+
+# Grid over junction positions for GPS ping -> junction lookup
+spatial_index = JunctionGrid.from_registry(registry)
+
+# Road graph over the junctions for time-dependent routing, cached on disk;
+# GLOSA_ROUTING_WORKERS > 0 spreads bulk routing over a process pool
+road_graph = cached_graph(registry)
+ROUTING_WORKERS = int(os.environ.get("GLOSA_ROUTING_WORKERS", 0))
+routing_executor = None
+
+# Pushes phase changes to /stream subscribers from a single deadline heap,
+# and follows live density like /predict; state versions tell it when to recompute
+broadcaster = PhaseBroadcaster(
+    registry, read=state.read, boundaries=densities.boundaries, versions=state["version"]
+)
+
+MAX_STREAM_JUNCTIONS = 1000
+DENSITY_EXPIRY_INTERVAL = 1.0  # seconds
+SSE_HEARTBEAT_SECONDS = 15
+
+async def expire_densities():
+    # A lapsed sample's boundary no longer applies: bump the rows so cached
+    # windows and stream deadlines derived from it are recomputed in every worker
+    while True:
+        await asyncio.sleep(DENSITY_EXPIRY_INTERVAL)
+        if densities.expired():
+            with state.write():
+                state.touch(densities.expire())
+
+@asynccontextmanager
+async def lifespan(app):
+    global routing_executor
+    tasks = [asyncio.create_task(broadcaster.run()), asyncio.create_task(expire_densities())]
+    if ROUTING_WORKERS:
+        routing_executor = routing_pool(road_graph, ROUTING_WORKERS)
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        if routing_executor is not None:
+            routing_executor.shutdown(cancel_futures=True)
+
+app = FastAPI(title="GLOSA AI Prediction Service", lifespan=lifespan)
+
+# Bounded EDF queue and deadline shedding on the hot routes, plus per-client rate
+# limits only when GLOSA_CLIENT_RATE is set: the Node backend proxies the whole
+# fleet, so a default per-peer limit would cap every vehicle together. Added before
+# the metrics middleware so shed responses still appear in the request counters
+# (as route "unmatched", since they never reach the router).
+CLIENT_RATE = os.environ.get("GLOSA_CLIENT_RATE")
+CLIENT_BURST = os.environ.get("GLOSA_CLIENT_BURST")
+admission = AdmissionController(
+    rate=float(CLIENT_RATE) if CLIENT_RATE else None,
+    burst=float(CLIENT_BURST) if CLIENT_BURST else None,
+    max_concurrent=int(os.environ.get("GLOSA_MAX_CONCURRENT", 256)),
+    max_queue=int(os.environ.get("GLOSA_MAX_QUEUE", 1024)),
+)
+# Peers allowed to name the vehicle they forward for with X-Client-Id
+TRUSTED_PROXIES = [
+    p.strip() for p in os.environ.get("GLOSA_TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if p.strip()
+]
+app.add_middleware(AdmissionMiddleware, controller=admission,
+                   prefixes=("/predict", "/advisory", "/junctions", "/corridor/plan", "/routes"),
+                   trusted_proxies=TRUSTED_PROXIES)
+
+# Per-route latency, in-flight requests and hot-path stage timers
+metrics = Metrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+MAX_LOOKAHEAD_WINDOWS = 120
+MAX_CORRIDOR_JUNCTIONS = 50
+MAX_ROUTE_PAIRS = 10000
 
 class PredictionRequest(BaseModel):
     junction_id: str
@@ -16,35 +148,660 @@ class PredictionResponse(BaseModel):
     seconds_to_change: float
     cycle_time: int = 60
 
+class BatchPredictionRequest(BaseModel):
+    junction_ids: List[str]
+    # One timestamp per junction, or a single timestamp shared by all of them
+    timestamps: List[float]
+
+class BatchPredictionResponse(BaseModel):
+    # Column layout: entry i of every list belongs to junction_ids[i]
+    junction_ids: List[str]
+    current_status: List[str]
+    seconds_to_change: List[float]
+    cycle_time: List[int]
+
+class BatchAdvisoryRequest(BaseModel):
+    # Entry i of every list describes one vehicle approaching junction_ids[i]
+    junction_ids: List[str]
+    lats: List[float]
+    lngs: List[float]
+    # One timestamp per vehicle, or a single timestamp shared by all of them
+    timestamps: List[float]
+
+class BatchAdvisoryResponse(BaseModel):
+    junction_ids: List[str]
+    distance: List[int]
+    signal_status: List[str]
+    seconds_to_change: List[float]
+    recommended_speed: List[int]  # km/h
+    message: List[str]
+
+class NearestJunctionRequest(BaseModel):
+    lats: List[float]
+    lngs: List[float]
+    # Degrees clockwise from north; null entries match junctions in any direction
+    headings: Optional[List[Optional[float]]] = None
+    max_distance: float = Field(500.0, gt=0, le=5000)
+
+class NearestJunctionResponse(BaseModel):
+    # null where no junction lies within max_distance (ahead of the vehicle)
+    junction_ids: List[Optional[str]]
+    distance: List[Optional[int]]
+
+class ObservationBatch(BaseModel):
+    # Event i: junction_ids[i] switched to statuses[i] at timestamps[i]
+    junction_ids: List[str]
+    statuses: List[str]
+    timestamps: List[float]
+
+class DensityBatch(BaseModel):
+    # Sample i: queue density (0-1) at junction_ids[i], optionally per approach
+    junction_ids: List[str]
+    densities: List[float]
+    approaches: Optional[List[int]] = None
+    timestamp: Optional[float] = None
+
+class LookaheadRequest(BaseModel):
+    junction_ids: List[str]
+    timestamp: float
+    # Number of windows to return, starting with the phase in progress
+    count: int = Field(3, ge=1, le=MAX_LOOKAHEAD_WINDOWS)
+    # If set, only windows starting within this many seconds are returned,
+    # still at most `count` of them
+    horizon: Optional[float] = Field(None, gt=0)
+
+class LookaheadResponse(BaseModel):
+    # Entry i of every list holds the windows of junction_ids[i]
+    junction_ids: List[str]
+    status: List[List[str]]
+    start: List[List[float]]
+    end: List[List[float]]
+    cycle_time: List[int]
+
+class CorridorRequest(BaseModel):
+    # Junctions in driving order; the vehicle is at (lat, lng) at `timestamp`
+    junction_ids: List[str] = Field(..., min_length=1, max_length=MAX_CORRIDOR_JUNCTIONS)
+    lat: float
+    lng: float
+    timestamp: float
+
+class CorridorResponse(BaseModel):
+    # Entry i of every list describes junction_ids[i]; times are seconds after departure
+    junction_ids: List[str]
+    departure: float
+    stops: int
+    travel_time: float
+    distance: List[int]
+    arrival: List[float]
+    signal_status: List[str]
+    stopped: List[bool]
+    recommended_speed: List[int]
+
+class RouteBatchRequest(BaseModel):
+    # Entry i of origins and destinations is one trip
+    origins: List[str] = Field(..., max_length=MAX_ROUTE_PAIRS)
+    destinations: List[str] = Field(..., max_length=MAX_ROUTE_PAIRS)
+    # One departure time per trip, or a single one shared by all of them
+    timestamps: List[float]
+
+class RouteBatchResponse(BaseModel):
+    # Unreachable trips have null times and an empty path
+    travel_time: List[Optional[float]]
+    signal_wait: List[Optional[float]]
+    distance: List[Optional[int]]
+    stops: List[Optional[int]]
+    path: List[List[str]]
+
 @app.get("/")
 def read_root():
     return {"status": "GLOSA AI Service Running"}
 
+def snapshot(rows):
+    # Plans and live density boundaries for the rows, consistent against concurrent writers
+    return state.read(lambda: (registry.plans[rows], densities.boundaries(rows)))
+
+def predict_phase_arrays(plans, boundaries, timestamps):
+    # The active model sees each junction's plan (cycle length, Green/Red
+    # splits and offset) next to the timestamp; the default "schedule" model
+    # simply follows the fixed-time plan
+    start = time.perf_counter()
+    status, to_change = models.predict(build_features(plans, timestamps))
+    # Adaptive signals react to live queues: a sample moves the end of the
+    # phase it arrived in, and status and countdown both follow that boundary
+    status, to_change = apply_boundaries(timestamps, status, to_change, boundaries)
+    metrics.observe_stage("phase_computation", time.perf_counter() - start)
+    return status, to_change
+
+def predict_phases(junction_ids, timestamps):
+    # NumPy columns; encode_response turns them into the negotiated format
+    plans, boundaries = snapshot(registry.rows(junction_ids))
+    status, to_change = predict_phase_arrays(plans, boundaries, timestamps)
+    return {
+        "status": status,
+        "seconds_to_change": np.round(to_change, 1),
+        "cycle_time": plans["cycle_time"].astype(np.int64),
+    }
+
+def prediction_document(junction_ids, columns):
+    return {
+        "junction_ids": junction_ids,
+        "current_status": STATUS_LABELS[columns["status"]].tolist(),
+        "seconds_to_change": columns["seconds_to_change"],
+        "cycle_time": columns["cycle_time"],
+    }
+
+def predict_requests(requests):
+    junction_ids = [r.junction_id for r in requests]
+    columns = predict_phases(
+        junction_ids,
+        np.fromiter((r.timestamp for r in requests), dtype=np.float64, count=len(requests)),
+    )
+    return [
+        {
+            "junction_id": junction_id,
+            "current_status": status,
+            "seconds_to_change": to_change,
+            "cycle_time": cycle_time,
+        }
+        for junction_id, status, to_change, cycle_time in zip(
+            junction_ids, STATUS_LABELS[columns["status"]].tolist(),
+            columns["seconds_to_change"].tolist(), columns["cycle_time"].tolist(),
+        )
+    ]
+
+def encode_response(http_request, document, kind, columns, headers=None):
+    # JSON (orjson when available), MessagePack or fixed-width struct columns,
+    # chosen from the Accept header
+    media_type = negotiate(http_request.headers.get("accept"))
+    if media_type == STRUCT:
+        layout = PREDICTION_COLUMNS if kind == PREDICTION else ADVISORY_COLUMNS
+        body = pack_columns(kind, layout, columns)
+    elif media_type == MSGPACK:
+        body = dumps_msgpack(document)
+    else:
+        body = dumps_json(document)
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept", **(headers or {})})
+
+# Single /predict calls are queued and answered in micro-batches
+dispatcher = MicroBatcher(
+    predict_requests,
+    window=float(os.environ.get("GLOSA_BATCH_WINDOW_MS", "2")) / 1000,
+    max_batch_size=int(os.environ.get("GLOSA_MAX_BATCH_SIZE", "256")),
+)
+
+# Answers repeat requests for a junction until its current phase ends
+prediction_cache = PhaseWindowCache(
+    max_entries=int(os.environ.get("GLOSA_CACHE_ENTRIES", "100000"))
+)
+
+# Identical in-flight predictions (same junction and time bucket) are coalesced
+single_flight = SingleFlight()
+
+# Green-wave plans per corridor and arrival second at its first junction
+corridor_cache = CorridorPlanCache()
+SINGLE_FLIGHT_BUCKET = float(os.environ.get("GLOSA_SINGLE_FLIGHT_BUCKET", "1"))
+
+async def cached_prediction(request):
+    # Read before predicting: a write landing meanwhile leaves the entry already stale
+    version = state.version(registry.row(request.junction_id))
+    entry = prediction_cache.get(request.junction_id, request.timestamp, version)
+    if entry is not None:
+        _, end, status, cycle_time, _ = entry
+        result = {
+            "junction_id": request.junction_id,
+            "current_status": status,
+            "seconds_to_change": round(end - request.timestamp, 1),
+            "cycle_time": cycle_time,
+        }
+        return result, end
+
+    # Vehicles converging on one junction share a single predictor call per
+    # time bucket; each answer is then re-expressed for its own timestamp
+    bucket = int(request.timestamp // SINGLE_FLIGHT_BUCKET)
+    result = await single_flight.do(
+        (request.junction_id, bucket),
+        lambda: dispatcher.submit(PredictionRequest(
+            junction_id=request.junction_id, timestamp=bucket * SINGLE_FLIGHT_BUCKET,
+        )),
+    )
+    end = bucket * SINGLE_FLIGHT_BUCKET + result["seconds_to_change"]
+    if end > request.timestamp:
+        result = dict(result, seconds_to_change=round(end - request.timestamp, 1))
+    else:
+        # The phase changed inside the bucket, so the shared answer is stale
+        result = await dispatcher.submit(request)
+        end = request.timestamp + result["seconds_to_change"]
+    prediction_cache.put(
+        request.junction_id, request.timestamp, end, result["current_status"], result["cycle_time"], version
+    )
+    return result, end
+
+def not_modified(http_request, response, result, end):
+    # Let the Node layer and HTTP proxies reuse the answer until the phase ends
+    etag = window_etag(result["junction_id"], result["current_status"], end)
+    response.headers["Cache-Control"] = f"max-age={int(result['seconds_to_change'])}"
+    response.headers["ETag"] = etag
+    if_none_match = http_request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=dict(response.headers))
+    return None
+
+def prediction_response(http_request, response, result, end):
+    cached = not_modified(http_request, response, result, end)
+    if cached is not None:
+        return cached
+    columns = {
+        "status": [STATUS_CODES[result["current_status"]]],
+        "seconds_to_change": [result["seconds_to_change"]],
+        "cycle_time": [result["cycle_time"]],
+    }
+    return encode_response(http_request, result, PREDICTION, columns, headers=dict(response.headers))
+
 @app.post("/predict", response_model=PredictionResponse)
-def predict_signal(request: PredictionRequest):
-    # In a real scenario, this would load a pre-trained Random Forest/LSTM model
-    # For the demo, we simulate a 60-second cycle (30s Green, 25s Red, 5s Amber)
-    
-    cycle_time = 60
-    current_time = request.timestamp % cycle_time
-    
-    if current_time < 30:
-        status = "GREEN"
-        to_change = 30 - current_time
-    elif current_time < 55:
-        status = "RED"
-        to_change = 55 - current_time
+async def predict_signal(request: PredictionRequest, http_request: Request, response: Response):
+    metrics.mark_validated(http_request)
+    result, end = await cached_prediction(request)
+    metrics.mark_handled(http_request)
+    return prediction_response(http_request, response, result, end)
+
+@app.get("/predict/{junction_id}", response_model=PredictionResponse)
+async def predict_signal_get(junction_id: str, http_request: Request, response: Response,
+                             timestamp: Optional[float] = None):
+    # Cacheable GET form of /predict; timestamp defaults to now
+    request = PredictionRequest(
+        junction_id=junction_id, timestamp=time.time() if timestamp is None else timestamp
+    )
+    result, end = await cached_prediction(request)
+    return prediction_response(http_request, response, result, end)
+
+@app.post("/predict/batch", response_model=BatchPredictionResponse)
+def predict_signal_batch(request: BatchPredictionRequest, http_request: Request):
+    metrics.mark_validated(http_request)
+    n = len(request.junction_ids)
+    if len(request.timestamps) not in (1, n):
+        raise HTTPException(
+            status_code=422,
+            detail="timestamps must have one entry or one per junction_id",
+        )
+
+    timestamps = np.broadcast_to(np.asarray(request.timestamps, dtype=np.float64), (n,))
+    columns = predict_phases(request.junction_ids, timestamps)
+    headers = {}
+    if n:
+        # The whole batch is fresh until its earliest phase change
+        headers["Cache-Control"] = f"max-age={int(columns['seconds_to_change'].min())}"
+    metrics.mark_handled(http_request)
+    return encode_response(
+        http_request, prediction_document(request.junction_ids, columns), PREDICTION, columns, headers
+    )
+
+@app.post("/advisory/batch", response_model=BatchAdvisoryResponse)
+def advisory_batch(request: BatchAdvisoryRequest, http_request: Request):
+    metrics.mark_validated(http_request)
+    n = len(request.junction_ids)
+    if len(request.lats) != n or len(request.lngs) != n or len(request.timestamps) not in (1, n):
+        raise HTTPException(
+            status_code=422,
+            detail="lats and lngs need one entry per junction_id; timestamps one or one per junction_id",
+        )
+
+    rows = registry.rows(request.junction_ids)
+    if (rows < 0).any():
+        missing = sorted({request.junction_ids[i] for i in np.flatnonzero(rows < 0)})
+        raise HTTPException(status_code=404, detail=f"Junction not found: {', '.join(missing)}")
+
+    plans, boundaries = snapshot(rows)
+    timestamps = np.broadcast_to(np.asarray(request.timestamps, dtype=np.float64), (n,))
+    distance = haversine(request.lats, request.lngs, plans["lat"], plans["lng"])
+    status, to_change = predict_phase_arrays(plans, boundaries, timestamps)
+    # The Node path advises on the rounded value returned by /predict
+    to_change = np.round(to_change, 1)
+    speed, message = calculate_advisory(distance, to_change, status)
+
+    metrics.mark_handled(http_request)
+    distance = np.floor(distance + 0.5).astype(np.int64)
+    document = {
+        "junction_ids": request.junction_ids,
+        "distance": distance,
+        "signal_status": STATUS_LABELS[status].tolist(),
+        "seconds_to_change": to_change,
+        "recommended_speed": speed,
+        "message": ADVISORY_MESSAGES[message].tolist(),
+    }
+    columns = {
+        "seconds_to_change": to_change, "distance": distance, "status": status,
+        "recommended_speed": speed, "message": message,
+    }
+    return encode_response(http_request, document, ADVISORY, columns)
+
+@app.post("/junctions/nearest", response_model=NearestJunctionResponse)
+def nearest_junctions(request: NearestJunctionRequest):
+    n = len(request.lats)
+    if len(request.lngs) != n or (request.headings is not None and len(request.headings) != n):
+        raise HTTPException(status_code=422, detail="lats, lngs and headings must have equal length")
+
+    headings = None
+    if request.headings is not None:
+        headings = np.array([np.nan if h is None else h for h in request.headings], dtype=np.float64)
+    index, distance = spatial_index.nearest(
+        request.lats, request.lngs, headings=headings, max_distance=request.max_distance
+    )
+
+    found = index >= 0
+    rows = spatial_index.rows[index[found]].tolist()
+    junction_ids = [None] * n
+    distances = [None] * n
+    for i, row, d in zip(np.flatnonzero(found).tolist(), rows, distance[found].tolist()):
+        junction_ids[i] = registry.ids[row]
+        distances[i] = int(d + 0.5)
+    return {"junction_ids": junction_ids, "distance": distances}
+
+def service_gauges():
+    yield ("glosa_dispatcher_queue_depth", "gauge", "Predictions waiting for the next micro-batch.",
+           dispatcher.queue_depth)
+    yield ("glosa_dispatcher_batches_total", "counter", "Micro-batches flushed.", dispatcher.batches)
+    yield ("glosa_dispatcher_items_total", "counter", "Predictions served through micro-batches.",
+           dispatcher.items)
+    yield ("glosa_dispatcher_wait_seconds_total", "counter", "Total queueing delay before flush.",
+           dispatcher.total_wait)
+    yield ("glosa_cache_hits_total", "counter", "Predictions answered from the window cache.",
+           prediction_cache.hits)
+    yield ("glosa_cache_misses_total", "counter", "Window cache misses.", prediction_cache.misses)
+    yield ("glosa_cache_entries", "gauge", "Junction windows currently cached.", len(prediction_cache))
+    yield ("glosa_cache_invalidations_total", "counter",
+           "Cached windows dropped because the junction's state changed.", prediction_cache.invalidations)
+    yield ("glosa_singleflight_deduplicated_total", "counter",
+           "Predictions that shared an identical in-flight call.", single_flight.deduplicated)
+    yield ("glosa_density_live_junctions", "gauge", "Junctions with an unexpired density sample.",
+           densities.live_count())
+    yield ("glosa_stream_subscribers", "gauge", "Open phase stream subscriptions.",
+           broadcaster.subscriber_count)
+    yield ("glosa_admission_queue_depth", "gauge", "Requests waiting for an admission slot.",
+           admission.queue_depth)
+    yield ("glosa_admission_admitted_total", "counter", "Requests admitted to the hot routes.",
+           admission.admitted)
+    for reason, count in admission.shed.items():
+        yield (f"glosa_admission_shed_{reason}_total", "counter",
+               f"Requests shed before running ({reason.replace('_', ' ')}).", count)
+
+metrics.add_collector(service_gauges)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/observations")
+def ingest_observations(batch: ObservationBatch):
+    if not len(batch.junction_ids) == len(batch.statuses) == len(batch.timestamps):
+        raise HTTPException(status_code=422, detail="junction_ids, statuses and timestamps must have equal length")
+
+    accepted, rejected = plan_estimator.accepted, plan_estimator.rejected
+    statuses = [STATUS_CODES.get(status.upper(), -1) for status in batch.statuses]
+    with state.write():
+        rows, updated = plan_estimator.observe_many(batch.junction_ids, statuses, batch.timestamps)
+        accepted_events = rows >= 0
+        events = np.zeros(int(accepted_events.sum()), dtype=PHASE_EVENT_DTYPE)
+        events["timestamp"] = np.asarray(batch.timestamps)[accepted_events]
+        events["status"] = np.asarray(statuses, dtype=np.int8)[accepted_events]
+        phase_history.append(rows[accepted_events], events)
+        # Cached windows of republished plans go stale in every worker
+        state.touch(list(updated))
+
+    return {
+        "accepted": plan_estimator.accepted - accepted,
+        "rejected": plan_estimator.rejected - rejected,
+        "plans_updated": len(updated),
+    }
+
+@app.get("/plans/{junction_id}")
+def get_plan(junction_id: str):
+    row = registry.row(junction_id)
+    if row < 0:
+        raise HTTPException(status_code=404, detail="Junction not found")
+    plan, estimator = state.read(lambda: (registry.plans[row].copy(), plan_estimator.describe(row)))
+    return {
+        "junction_id": junction_id,
+        "cycle_time": float(plan["cycle_time"]),
+        "green": float(plan["green"]),
+        "red": float(plan["red"]),
+        "amber": float(plan["cycle_time"] - plan["green"] - plan["red"]),
+        "offset": float(plan["offset"]),
+        "estimator": estimator,
+    }
+
+@app.post("/density")
+def ingest_density(batch: DensityBatch):
+    n = len(batch.junction_ids)
+    if len(batch.densities) != n or (batch.approaches is not None and len(batch.approaches) != n):
+        raise HTTPException(status_code=422, detail="densities and approaches need one entry per junction_id")
+
+    now = time.time() if batch.timestamp is None else batch.timestamp
+    rows = registry.rows(batch.junction_ids)
+    known = rows >= 0
+    samples = np.zeros(int(known.sum()), dtype=DENSITY_DTYPE)
+    samples["timestamp"] = now
+    samples["density"] = np.clip(np.asarray(batch.densities, dtype=np.float32)[known], 0.0, 1.0)
+    if batch.approaches is not None:
+        samples["approach"] = np.asarray(batch.approaches)[known]
+
+    with state.write():
+        # A sample older than the junction's newest one is rejected, so history stays in time order
+        kept = density_history.append(rows[known], samples)
+        updated = densities.update(rows[known][kept], samples["density"][kept], registry.plans, now=now)
+        # Windows cached before this sample no longer reflect the queue, in any worker
+        state.touch(updated)
+
+    accepted = int(kept.sum())
+    return {"accepted": accepted, "rejected": n - accepted}
+
+@app.get("/history/{junction_id}")
+def get_history(junction_id: str, kind: str = Query("phase", pattern="^(phase|density)$"),
+                hours: float = Query(6.0, gt=0), end: Optional[float] = None):
+    row = registry.row(junction_id)
+    if row < 0:
+        raise HTTPException(status_code=404, detail="Junction not found")
+    end = time.time() if end is None else end
+    store = phase_history if kind == "phase" else density_history
+    records = store.between(row, end - hours * 3600, end)
+
+    if kind == "phase":
+        return {
+            "junction_id": junction_id,
+            "timestamp": records["timestamp"].tolist(),
+            "status": STATUS_LABELS[records["status"]].tolist(),
+        }
+    return {
+        "junction_id": junction_id,
+        "timestamp": records["timestamp"].tolist(),
+        "approach": records["approach"].tolist(),
+        "density": records["density"].tolist(),
+    }
+
+@app.get("/models")
+def list_models():
+    return models.describe()
+
+@app.post("/models/{name}/activate")
+def activate_model(name: str, reload: bool = False):
+    # Loading and warmup happen before the swap, so traffic never waits on them.
+    # The model serves /predict, /predict/batch and /advisory/batch; lookahead,
+    # streaming, corridor plans and routing work from the signal plans directly.
+    try:
+        model = models.activate(name, reload=reload)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model {name}")
+    # Cached windows came from the previous model
+    prediction_cache.clear()
+    return {"active": {"name": model.name, "version": model.version}}
+
+@app.get("/admission/stats")
+def admission_stats():
+    return admission.stats()
+
+@app.get("/corridor/stats")
+def corridor_stats():
+    return corridor_cache.stats()
+
+@app.get("/cache/stats")
+def cache_stats():
+    return prediction_cache.stats()
+
+@app.get("/singleflight/stats")
+def single_flight_stats():
+    return single_flight.stats()
+
+@app.get("/dispatcher/stats")
+def dispatcher_stats():
+    return dispatcher.stats()
+
+@app.post("/predict/lookahead", response_model=LookaheadResponse)
+def predict_lookahead(request: LookaheadRequest):
+    # The schedule is deterministic, so clients can count down locally
+    # from these windows instead of polling /predict every second
+    rows = registry.rows(request.junction_ids)
+    plans, boundaries = snapshot(rows)
+    count = request.count
+    if request.horizon is not None:
+        durations = np.concatenate([plans["green"], plans["red"],
+                                    plans["cycle_time"] - plans["green"] - plans["red"]])
+        shortest = np.min(durations[durations > 0], initial=np.inf)
+        # One extra window for the phase in progress, one for a red a density sample cut short
+        needed = int(np.ceil(request.horizon / shortest)) + 2 if np.isfinite(shortest) else 1
+        if needed > MAX_LOOKAHEAD_WINDOWS:
+            raise HTTPException(
+                status_code=422,
+                detail=f"horizon needs up to {needed} windows; at most {MAX_LOOKAHEAD_WINDOWS} are served",
+            )
+        count = min(count, needed)
+
+    # Live density boundaries apply as in /predict
+    status, start, end = boundary_windows(
+        np.full(len(request.junction_ids), request.timestamp), count, plans, boundaries
+    )
+    start, end = np.round(start, 1), np.round(end, 1)
+    labels = STATUS_LABELS[status]
+
+    if request.horizon is None:
+        status_cols, start_cols, end_cols = labels.tolist(), start.tolist(), end.tolist()
     else:
-        status = "AMBER"
-        to_change = 60 - current_time
-        
+        keep = start < request.timestamp + request.horizon
+        status_cols = [row[mask].tolist() for row, mask in zip(labels, keep)]
+        start_cols = [row[mask].tolist() for row, mask in zip(start, keep)]
+        end_cols = [row[mask].tolist() for row, mask in zip(end, keep)]
+
     return {
-        "junction_id": request.junction_id,
-        "current_status": status,
-        "seconds_to_change": round(to_change, 1),
-        "cycle_time": cycle_time
+        "junction_ids": request.junction_ids,
+        "status": status_cols,
+        "start": start_cols,
+        "end": end_cols,
+        "cycle_time": plans["cycle_time"].astype(np.int64).tolist(),
     }
 
+@app.post("/corridor/plan", response_model=CorridorResponse)
+def corridor_plan(request: CorridorRequest):
+    # Speeds that cross the most greens along the whole route, not just the
+    # next junction. Uses the signal schedules; live density is ignored this far ahead.
+    rows = registry.rows(request.junction_ids)
+    if (rows < 0).any():
+        missing = sorted({request.junction_ids[i] for i in np.flatnonzero(rows < 0)})
+        raise HTTPException(status_code=404, detail=f"Junction not found: {', '.join(missing)}")
+    plans = state.read(lambda: registry.plans[rows])
+    # Straight-line legs: vehicle -> first junction, then junction to junction
+    lats = np.concatenate([[request.lat], plans["lat"]])
+    lngs = np.concatenate([[request.lng], plans["lng"]])
+    segments = haversine(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+    try:
+        plan = corridor_cache.plan(request.junction_ids, plans, segments, request.timestamp)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return {
+        "junction_ids": request.junction_ids,
+        "departure": request.timestamp,
+        "stops": int(plan["stopped"].sum()),
+        "travel_time": float(plan["arrival"][-1]),
+        "distance": np.floor(segments + 0.5).astype(np.int64).tolist(),
+        "arrival": plan["arrival"].tolist(),
+        "signal_status": STATUS_LABELS[plan["status"]].tolist(),
+        "stopped": plan["stopped"].tolist(),
+        "recommended_speed": np.floor(plan["speed"] * 3.6).astype(np.int64).tolist(),
+    }
+
+@app.post("/routes/batch", response_model=RouteBatchResponse)
+def route_batch(request: RouteBatchRequest):
+    # Fastest routes given the signal waits predicted along the way
+    n = len(request.origins)
+    if len(request.destinations) != n or len(request.timestamps) not in (1, n):
+        raise HTTPException(
+            status_code=422,
+            detail="destinations need one entry per origin; timestamps one or one per origin",
+        )
+    origins = registry.rows(request.origins)
+    destinations = registry.rows(request.destinations)
+    unknown = (origins < 0) | (destinations < 0)
+    if unknown.any():
+        missing = sorted({j for i in np.flatnonzero(unknown)
+                          for j in (request.origins[i], request.destinations[i]) if registry.row(j) < 0})
+        raise HTTPException(status_code=404, detail=f"Junction not found: {', '.join(missing)}")
+
+    plans = state.read(lambda: registry.plans.copy())
+    departures = np.broadcast_to(np.asarray(request.timestamps, dtype=np.float64), (n,))
+    routes = route_many(road_graph, plans, origins, destinations, departures, executor=routing_executor)
+    return {
+        "travel_time": [r and round(r["travel_time"], 1) for r in routes],
+        "signal_wait": [r and round(r["signal_wait"], 1) for r in routes],
+        "distance": [r and int(r["distance"] + 0.5) for r in routes],
+        "stops": [r and r["stops"] for r in routes],
+        "path": [[registry.ids[row] for row in r["path"]] if r else [] for r in routes],
+    }
+
+def parse_stream_ids(junction_ids):
+    ids = [j for j in junction_ids.split(",") if j]
+    if not ids or len(ids) > MAX_STREAM_JUNCTIONS:
+        raise ValueError(f"subscribe to between 1 and {MAX_STREAM_JUNCTIONS} junctions")
+    return ids
+
+@app.websocket("/stream")
+async def stream_phases(websocket: WebSocket, junction_ids: str = Query(...)):
+    # Sends the current phase of every junction on connect, then one message
+    # per phase change. Reconnect to change the subscribed set.
+    try:
+        ids = parse_stream_ids(junction_ids)
+    except ValueError as exc:
+        await websocket.close(code=1008, reason=str(exc))
+        return
+
+    await websocket.accept()
+    subscription = broadcaster.subscribe(ids)
+    try:
+        while True:
+            await websocket.send_json(await subscription.get())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+@app.get("/stream/sse")
+async def stream_phases_sse(junction_ids: str = Query(...)):
+    try:
+        ids = parse_stream_ids(junction_ids)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+    async def events():
+        subscription = broadcaster.subscribe(ids)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(message)}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
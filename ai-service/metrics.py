@@ -0,0 +1,145 @@
+"""
+Prometheus-style metrics for the AI service.
+
+Recording is a bisect into a fixed bucket tuple plus a few integer and
+float increments: no locks, no per-request objects beyond the numbers
+themselves. Requests are served on one event loop thread, and the rare
+race from handlers running in the threadpool can at worst drop a count,
+which is an acceptable trade for keeping the timers out of the latencies
+they measure. Cumulative buckets are only computed when /metrics is scraped.
+"""
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Keys stamped into the ASGI scope to time the stages around the handler
+START_KEY = "glosa.start"
+ADMITTED_KEY = "glosa.admitted"  # stamped by admission control once a slot is granted
+HANDLED_KEY = "glosa.handled"
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        cumulative += self.counts[-1]
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {cumulative}"
+
+
+class Metrics:
+    def __init__(self):
+        self.route_latency = {}
+        self.route_status = {}
+        self.stages = {}
+        self.in_flight = 0
+        self.collectors = []
+
+    def histogram(self, table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram()
+        return histogram
+
+    def observe_stage(self, stage, seconds):
+        self.histogram(self.stages, stage).observe(seconds)
+
+    def mark_validated(self, request):
+        # Time from admission (or arrival) to handler entry: body read, parsing
+        # and validation, without the wait for an admission slot
+        start = request.scope.get(ADMITTED_KEY, request.scope.get(START_KEY))
+        if start is not None:
+            self.observe_stage("validation", time.perf_counter() - start)
+
+    def mark_handled(self, request):
+        # Serialization is timed from here to the response start in the middleware
+        request.scope[HANDLED_KEY] = time.perf_counter()
+
+    def add_collector(self, collect):
+        """Register collect() -> iterable of (name, type, help, value) read at scrape."""
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = [
+            "# HELP glosa_http_in_flight_requests Requests currently being served.",
+            "# TYPE glosa_http_in_flight_requests gauge",
+            f"glosa_http_in_flight_requests {self.in_flight}",
+            "# HELP glosa_http_request_duration_seconds Request latency by route.",
+            "# TYPE glosa_http_request_duration_seconds histogram",
+        ]
+        for route, histogram in sorted(self.route_latency.items()):
+            lines.extend(histogram.samples("glosa_http_request_duration_seconds", f'route="{route}"'))
+        lines += [
+            "# HELP glosa_http_requests_total Responses by route and status code.",
+            "# TYPE glosa_http_requests_total counter",
+        ]
+        for route, statuses in sorted(self.route_status.items()):
+            for status, count in sorted(statuses.items()):
+                lines.append(f'glosa_http_requests_total{{route="{route}",status="{status}"}} {count}')
+        lines += [
+            "# HELP glosa_stage_duration_seconds Time spent in hot-path stages.",
+            "# TYPE glosa_stage_duration_seconds histogram",
+        ]
+        for stage, histogram in sorted(self.stages.items()):
+            lines.extend(histogram.samples("glosa_stage_duration_seconds", f'stage="{stage}"'))
+        for collect in self.collectors:
+            for name, kind, help_text, value in collect():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing every HTTP request by its matched route."""
+
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        metrics = self.metrics
+        start = scope[START_KEY] = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                handled = scope.get(HANDLED_KEY)
+                if handled is not None:
+                    metrics.observe_stage("serialization", time.perf_counter() - handled)
+            await send(message)
+
+        metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.in_flight -= 1
+            admitted = scope.get(ADMITTED_KEY)
+            if admitted is not None:
+                metrics.observe_stage("admission_queue", admitted - start)
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            metrics.histogram(metrics.route_latency, path).observe(time.perf_counter() - start)
+            statuses = metrics.route_status.get(path)
+            if statuses is None:
+                statuses = metrics.route_status[path] = {}
+            statuses[status] = statuses.get(status, 0) + 1
@@ -0,0 +1,185 @@
+"""
+Phase prediction models and their lifecycle.
+
+Every model implements batch `predict(features) -> (status, seconds_to_change)`
+over the feature matrix built by `build_features`. The registry loads models
+lazily, warms them with synthetic batches before they take traffic, and swaps
+the active model with a single reference assignment: requests that already
+hold the previous model finish on it, new requests see the new one.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+from phases import compute_phases
+
+FEATURE_COLUMNS = ("timestamp", "cycle_time", "green", "red", "offset")
+WARMUP_BATCH_SIZES = (1, 64, 1024)
+
+
+def build_features(plans, timestamps):
+    features = np.empty((len(plans), len(FEATURE_COLUMNS)), dtype=np.float64)
+    features[:, 0] = timestamps
+    for i, column in enumerate(FEATURE_COLUMNS[1:], start=1):
+        features[:, i] = plans[column]
+    return features
+
+
+def synthetic_features(n, rng=None):
+    """Random plans and timestamps shaped like the junctions we serve."""
+    rng = rng or np.random.default_rng()
+    cycle = rng.uniform(40, 180, n)
+    green = cycle * rng.uniform(0.25, 0.6, n)
+    amber = rng.uniform(3, 6, n)
+    red = cycle - green - amber
+    offset = rng.uniform(0, 1, n) * cycle
+    timestamps = time.time() + rng.uniform(0, 86400, n)
+    return np.column_stack([timestamps, cycle, green, red, offset])
+
+
+class ScheduleModel:
+    """Fixed-time plan arithmetic; the baseline every other model must beat."""
+
+    name = "schedule"
+    version = "1"
+
+    def predict(self, features):
+        t, cycle, green, red, offset = features.T
+        return compute_phases(t, cycle, green, red, offset)
+
+
+class BinnedPlanModel:
+    """Reference learned model: lookup tables over normalized plan geometry.
+
+    Features are reduced to the position within the cycle and the green and
+    red fractions of the cycle, each binned. Training records the majority
+    status and the mean position (as a cycle fraction) at which the phase
+    ends for every bin, so inference is a few index computations and two
+    gathers per batch.
+    """
+
+    name = "binned"
+
+    def __init__(self, position_bins=360, split_bins=24):
+        self.position_bins = position_bins
+        self.split_bins = split_bins
+        self.status_table = None
+        self.boundary_table = None
+        self.version = "untrained"
+
+    def _bins(self, features):
+        t, cycle, green, red, offset = features.T
+        position = np.mod(t - offset, cycle) / cycle
+        p = np.minimum((position * self.position_bins).astype(np.intp), self.position_bins - 1)
+        g = np.clip((green / cycle * self.split_bins).astype(np.intp), 0, self.split_bins - 1)
+        r = np.clip((red / cycle * self.split_bins).astype(np.intp), 0, self.split_bins - 1)
+        return (p * self.split_bins + g) * self.split_bins + r, position, cycle
+
+    def fit(self, features, status, seconds_to_change):
+        cells = self.position_bins * self.split_bins ** 2
+        index, position, cycle = self._bins(features)
+        votes = np.bincount(index * 3 + status, minlength=cells * 3).reshape(cells, 3)
+        boundary = np.bincount(index, position + seconds_to_change / cycle, minlength=cells)
+        counts = np.bincount(index, minlength=cells)
+
+        self.status_table = votes.argmax(axis=1).astype(np.int8)
+        self.boundary_table = np.divide(boundary, counts, out=np.zeros(cells), where=counts > 0)
+        self.version = f"trained-{len(features)}"
+        return self
+
+    def predict(self, features):
+        index, position, cycle = self._bins(features)
+        remaining = np.maximum(self.boundary_table[index] - position, 0.0) * cycle
+        return self.status_table[index], remaining
+
+    def save(self, path):
+        np.savez(path, status=self.status_table, boundary=self.boundary_table,
+                 shape=[self.position_bins, self.split_bins], version=self.version)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            model = cls(*data["shape"].tolist())
+            model.status_table = data["status"]
+            model.boundary_table = data["boundary"]
+            model.version = str(data["version"])
+        return model
+
+    @classmethod
+    def train_synthetic(cls, samples=2_000_000, seed=0):
+        features = synthetic_features(samples, np.random.default_rng(seed))
+        status, to_change = ScheduleModel().predict(features)
+        return cls().fit(features, status, to_change)
+
+
+def load_binned_model():
+    path = os.environ.get("GLOSA_BINNED_MODEL_PATH")
+    if path and os.path.exists(path):
+        return BinnedPlanModel.load(path)
+    return BinnedPlanModel.train_synthetic()
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._factories = {}
+        self._loaded = {}
+        self._active = None
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        self._factories[name] = factory
+
+    @property
+    def names(self):
+        return sorted(self._factories)
+
+    @property
+    def active(self):
+        return self._active
+
+    def load(self, name, reload=False):
+        """Return the warmed model for `name`, building it on first use."""
+        if name not in self._factories:
+            raise KeyError(name)
+        with self._lock:
+            model = None if reload else self._loaded.get(name)
+            if model is None:
+                model = self._factories[name]()
+                warmup(model)
+                self._loaded[name] = model
+            return model
+
+    def activate(self, name, reload=False):
+        model = self.load(name, reload=reload)
+        # One reference assignment: in-flight batches keep the model they took
+        self._active = model
+        return model
+
+    def predict(self, features):
+        return self._active.predict(features)
+
+    def describe(self):
+        return {
+            "active": None if self._active is None else
+            {"name": self._active.name, "version": self._active.version},
+            "available": self.names,
+            "loaded": {name: model.version for name, model in self._loaded.items()},
+        }
+
+
+def warmup(model, batch_sizes=WARMUP_BATCH_SIZES):
+    # First calls pay for lazy allocation and code paths; do it off the hot path
+    rng = np.random.default_rng(0)
+    for size in batch_sizes:
+        status, to_change = model.predict(synthetic_features(size, rng))
+        if len(status) != size or len(to_change) != size:
+            raise ValueError(f"model {model.name} returned a batch of the wrong size")
+
+
+def default_registry():
+    registry = ModelRegistry()
+    registry.register(ScheduleModel.name, ScheduleModel)
+    registry.register(BinnedPlanModel.name, load_binned_model)
+    return registry
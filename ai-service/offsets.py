@@ -0,0 +1,293 @@
+"""
+Offline signal-offset optimizer for two-way green waves.
+
+For each corridor (an ordered list of junction ids) this searches the
+junction offsets that maximize the green-wave bandwidth in both
+directions, in the spirit of MAXBAND: a platoon driving the corridor at
+the design speed should meet green everywhere for as many seconds of the
+cycle as possible, outbound and inbound.
+
+MAXBAND needs one common cycle, so every junction of a corridor runs on
+the longest cycle in the corridor, with its green scaled to keep the same
+green ratio; the recommended cycle is reported with the offsets. Time is
+discretized to `step` seconds. The search is coordinate ascent from
+several random starts: one junction's offset is re-chosen at a time,
+with every candidate offset for every start scored in one NumPy pass.
+Bandwidth is maximized first and green alignment breaks ties, so the
+search still moves while no common band exists yet.
+Corridors are independent, so they are spread over a process pool:
+
+    python offsets.py --corridors corridors.json --output offsets.json
+    python offsets.py --synthetic 2000 --length 12 --workers 8
+
+corridors.json holds [{"name": ..., "junction_ids": [...]}, ...]. Without
+it, the registry junctions form one corridor ordered along their main axis.
+A junction shared by several corridors gets the offset from the corridor
+with the widest total band.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from advisory import haversine
+
+DESIGN_SPEED = 40.0  # km/h
+STEP = 1.0  # seconds
+
+
+def longest_run(mask):
+    """Longest circular run of True along the last axis, in bins."""
+    bins = mask.shape[-1]
+    # Scan with time as the leading axis: accumulate then runs over whole rows at once
+    time_first = np.ascontiguousarray(np.moveaxis(mask, -1, 0))
+    doubled = np.concatenate([time_first, time_first])
+    idx = np.arange(2 * bins, dtype=np.int16).reshape((-1,) + (1,) * (mask.ndim - 1))
+    last_false = np.maximum.accumulate(np.where(doubled, np.int16(-1), idx), axis=0)
+    return np.minimum((idx - last_false).max(axis=0), bins).astype(np.intp)
+
+
+def longest_run_in_arcs(mask, starts, length):
+    """Longest run of a circular mask (rows, bins) inside each arc [start, start + length).
+
+    Returns (rows, len(starts)). Only the runs of `mask` are enumerated, so
+    scoring every arc costs rows * arcs * runs instead of rows * arcs * bins.
+    """
+    rows, bins = mask.shape
+    if length >= bins:
+        # The arc is the whole cycle, so runs may wrap around it
+        return np.repeat(longest_run(mask)[:, None], len(starts), axis=1)
+    # Runs of the doubled mask cover every arc that wraps past the end of the cycle
+    padded = np.zeros((rows, 2 * bins + 2), dtype=np.int8)
+    padded[:, 1:bins + 1] = mask
+    padded[:, bins + 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    run_start = np.flatnonzero(edges == 1)
+    run_end = np.flatnonzero(edges == -1)
+    row = run_start // (2 * bins + 1)
+    first = np.searchsorted(row, np.arange(rows))
+    rank = np.arange(len(row)) - first[row]
+    width = int(rank.max()) + 1 if len(row) else 1
+    lo = np.zeros((rows, width), dtype=np.intp)
+    hi = np.zeros((rows, width), dtype=np.intp)
+    lo[row, rank] = run_start % (2 * bins + 1)
+    hi[row, rank] = run_end % (2 * bins + 1)
+
+    arc_lo = np.asarray(starts)[None, :, None]
+    overlap = np.minimum(hi[:, None, :], arc_lo + length) - np.maximum(lo[:, None, :], arc_lo)
+    return np.maximum(overlap, 0).max(axis=-1)
+
+
+def bandwidths(green_masks, travel_out, travel_in, offsets):
+    """Outbound and inbound band, in bins, for offsets of shape (..., n)."""
+    n, bins = green_masks.shape
+    t = np.arange(bins)
+    # Junction k is green for an outbound platoon that left the first junction at t
+    # when (t + travel_out[k] - offset[k]) falls in its green
+    out_idx = (t + travel_out[:, None] - offsets[..., :, None]) % bins
+    in_idx = (t + travel_in[:, None] - offsets[..., :, None]) % bins
+    rows = np.arange(n)[:, None]
+    band_out = green_masks[rows, out_idx].all(axis=-2)
+    band_in = green_masks[rows, in_idx].all(axis=-2)
+    return longest_run(band_out), longest_run(band_in)
+
+
+def optimize_corridor(cycle_times, greens, positions, offsets=None, speed=DESIGN_SPEED, step=STEP,
+                      restarts=8, sweeps=6, seed=0):
+    """Search offsets for one corridor.
+
+    cycle_times, greens and the current offsets are per junction in
+    seconds; positions are metres along the corridor from its first
+    junction. Returns the common cycle, optimized offsets and the
+    outbound/inbound bandwidths in seconds, before and after.
+    """
+    cycle_times = np.asarray(cycle_times, dtype=np.float64)
+    n = len(cycle_times)
+    cycle = float(cycle_times.max())
+    bins = int(round(cycle / step))
+    green_bins = np.round(np.asarray(greens, dtype=np.float64) * cycle / cycle_times / step).astype(np.intp)
+    green_masks = np.arange(bins)[None, :] < green_bins[:, None]
+
+    positions = np.asarray(positions, dtype=np.float64)
+    travel = positions / (speed / 3.6) / step
+    travel_out = np.round(travel).astype(np.intp)
+    travel_in = np.round(travel[-1] - travel).astype(np.intp)
+
+    current = np.zeros(n, dtype=np.intp) if offsets is None else \
+        np.round(np.asarray(offsets, dtype=np.float64) / step).astype(np.intp) % bins
+    before_out, before_in = bandwidths(green_masks, travel_out, travel_in, current)
+
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, bins, size=(restarts, n))
+    starts[0] = current
+    starts[:, 0] = current[0]  # the first junction anchors the corridor; the band is shift-invariant
+
+    t = np.arange(bins)
+    candidates = np.arange(bins)
+    rows = np.arange(n)[:, None]
+    for _ in range(sweeps):
+        previous = starts.copy()
+        for k in range(1, n):
+            others = np.delete(np.arange(n), k)
+            # Band of every other junction for each start: (restarts, bins)
+            out_idx = (t + travel_out[others, None] - starts[:, others, None]) % bins
+            in_idx = (t + travel_in[others, None] - starts[:, others, None]) % bins
+            green_out = green_masks[rows[others], out_idx]
+            green_in = green_masks[rows[others], in_idx]
+            # Junction k under every candidate offset: (candidates, bins), shared by all starts.
+            # Its green is the arc starting at (offset - travel time).
+            mask_out = green_masks[k][(t + travel_out[k] - candidates[:, None]) % bins]
+            mask_in = green_masks[k][(t + travel_in[k] - candidates[:, None]) % bins]
+            band = (longest_run_in_arcs(green_out.all(axis=1), (candidates - travel_out[k]) % bins,
+                                        green_bins[k])
+                    + longest_run_in_arcs(green_in.all(axis=1), (candidates - travel_in[k]) % bins,
+                                          green_bins[k]))
+            # While the band is still empty it cannot guide the search, so ties are
+            # broken by how well greens line up: sum over t of (junctions green at t)^2,
+            # of which only the candidate's share varies
+            align = ((2 * green_out.sum(axis=1) + 1) @ mask_out.T
+                     + (2 * green_in.sum(axis=1) + 1) @ mask_in.T)
+            score = band * (2 * (2 * n + 1) * bins + 1) + align
+            # Keep the current offset on ties so sweeps converge
+            score = score * 2 + (candidates == starts[:, k, None])
+            starts[:, k] = score.argmax(axis=1)
+        if np.array_equal(starts, previous):
+            break
+
+    band_out, band_in = bandwidths(green_masks, travel_out, travel_in, starts)
+    best = int(np.argmax(band_out + band_in))
+    return {
+        "cycle_time": cycle,
+        "green": (green_bins * step).tolist(),
+        "offsets": (starts[best] * step).tolist(),
+        "bandwidth_outbound": float(band_out[best] * step),
+        "bandwidth_inbound": float(band_in[best] * step),
+        "baseline_outbound": float(before_out * step),
+        "baseline_inbound": float(before_in * step),
+    }
+
+
+def corridor_positions(lats, lngs):
+    """Metres along the polyline through the junctions, starting at 0."""
+    legs = haversine(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+    return np.concatenate([[0.0], np.cumsum(legs)])
+
+
+def _optimize_task(task):
+    name, junction_ids, cycle_times, greens, positions, offsets, options = task
+    result = optimize_corridor(cycle_times, greens, positions, offsets, **options)
+    return {"name": name, "junction_ids": junction_ids, **result}
+
+
+def optimize_network(tasks, workers=None):
+    """Optimize independent corridors in a process pool; results keep the input order."""
+    if workers == 1 or len(tasks) < 2:
+        return [_optimize_task(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunk = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+        return list(pool.map(_optimize_task, tasks, chunksize=chunk))
+
+
+def merge_offsets(results):
+    """One offset per junction, taken from the corridor with the widest total band."""
+    merged, conflicts = {}, 0
+    ranked = sorted(results, key=lambda r: r["bandwidth_outbound"] + r["bandwidth_inbound"], reverse=True)
+    for result in ranked:
+        for junction_id, offset in zip(result["junction_ids"], result["offsets"]):
+            if junction_id in merged:
+                conflicts += merged[junction_id]["offset"] != offset
+                continue
+            merged[junction_id] = {"offset": offset, "cycle_time": result["cycle_time"],
+                                   "corridor": result["name"]}
+    return merged, conflicts
+
+
+def registry_tasks(registry, corridors, options):
+    tasks = []
+    for corridor in corridors:
+        rows = registry.rows(corridor["junction_ids"])
+        if (rows < 0).any():
+            missing = [corridor["junction_ids"][i] for i in np.flatnonzero(rows < 0)]
+            raise SystemExit(f"corridor {corridor['name']}: unknown junctions {', '.join(missing)}")
+        plans = registry.plans[rows]
+        tasks.append((corridor["name"], list(corridor["junction_ids"]), plans["cycle_time"], plans["green"],
+                      corridor_positions(plans["lat"], plans["lng"]), plans["offset"], options))
+    return tasks
+
+
+def default_corridor(registry):
+    # Order the junctions along the principal axis of their positions
+    plans = registry.plans[:-1]
+    xy = np.column_stack([plans["lat"], plans["lng"] * np.cos(np.radians(plans["lat"]))])
+    xy -= xy.mean(axis=0)
+    axis = np.linalg.svd(xy, full_matrices=False)[2][0] if len(xy) > 1 else np.zeros(2)
+    order = np.argsort(xy @ axis, kind="stable")
+    return [{"name": "registry", "junction_ids": [registry.ids[i] for i in order]}]
+
+
+def synthetic_tasks(count, length, options, seed=0):
+    rng = np.random.default_rng(seed)
+    tasks = []
+    for c in range(count):
+        cycle_times = rng.choice([60.0, 90.0, 120.0], size=length)
+        greens = np.round(cycle_times * rng.uniform(0.35, 0.6, size=length))
+        positions = np.concatenate([[0.0], np.cumsum(rng.uniform(200, 900, size=length - 1))])
+        offsets = rng.uniform(0, cycle_times)
+        tasks.append((f"S{c}", [f"S{c}J{k}" for k in range(length)], cycle_times, greens, positions,
+                      offsets, options))
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize signal offsets for two-way green-wave bandwidth.")
+    parser.add_argument("--corridors", help="JSON list of {name, junction_ids} (default: one registry corridor)")
+    parser.add_argument("--synthetic", type=int, default=0, help="optimize N random corridors instead")
+    parser.add_argument("--length", type=int, default=10, help="junctions per synthetic corridor")
+    parser.add_argument("--speed", type=float, default=DESIGN_SPEED, help="design speed in km/h")
+    parser.add_argument("--restarts", type=int, default=8)
+    parser.add_argument("--sweeps", type=int, default=6)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--output", help="write the per-corridor results and merged offsets as JSON")
+    args = parser.parse_args()
+
+    options = {"speed": args.speed, "restarts": args.restarts, "sweeps": args.sweeps}
+    if args.synthetic:
+        tasks = synthetic_tasks(args.synthetic, args.length, options)
+    else:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from signal_plans import load_registry
+
+        registry = load_registry()
+        if args.corridors:
+            with open(args.corridors) as f:
+                corridors = json.load(f)
+        else:
+            corridors = default_corridor(registry)
+        tasks = registry_tasks(registry, corridors, options)
+
+    start = time.perf_counter()
+    results = optimize_network(tasks, args.workers)
+    elapsed = time.perf_counter() - start
+    merged, conflicts = merge_offsets(results)
+
+    before = sum(r["baseline_outbound"] + r["baseline_inbound"] for r in results)
+    after = sum(r["bandwidth_outbound"] + r["bandwidth_inbound"] for r in results)
+    print(f"{len(results)} corridors, {len(merged)} junctions in {elapsed:.1f}s "
+          f"({1e3 * elapsed / max(1, len(results)):.1f} ms/corridor)")
+    print(f"mean two-way bandwidth {before / max(1, len(results)):.1f}s -> {after / max(1, len(results)):.1f}s, "
+          f"{conflicts} shared-junction conflicts")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"corridors": results, "offsets": merged}, f, indent=2)
+        print(f"wrote {args.output}")
+    elif not args.synthetic:
+        for r in results:
+            print(json.dumps(r))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Vectorized signal phase math shared by the prediction endpoints.
+
+A cycle always runs GREEN -> RED -> AMBER, mirroring the simulated
+60-second plan used by /predict (30s Green, 25s Red, 5s Amber).
+"""
+import numpy as np
+
+GREEN, RED, AMBER = 0, 1, 2
+STATUS_LABELS = np.array(["GREEN", "RED", "AMBER"])
+STATUS_CODES = {"GREEN": GREEN, "RED": RED, "AMBER": AMBER}
+
+DEFAULT_CYCLE = 60.0
+DEFAULT_GREEN = 30.0
+DEFAULT_RED = 25.0
+
+
+def compute_phases(timestamps, cycle_time=DEFAULT_CYCLE, green=DEFAULT_GREEN,
+                   red=DEFAULT_RED, offset=0.0):
+    """Return (status codes, seconds to change) for every timestamp.
+
+    All plan arguments may be scalars or arrays broadcastable against
+    `timestamps`, so one call covers any number of junctions.
+    """
+    t = np.mod(np.asarray(timestamps, dtype=np.float64) - offset, cycle_time)
+    red_end = np.add(green, red)
+
+    in_green = t < green
+    in_red = ~in_green & (t < red_end)
+    status = np.full(t.shape, AMBER, dtype=np.int8)
+    status[in_green] = GREEN
+    status[in_red] = RED
+
+    boundary = np.where(in_green, green, np.where(in_red, red_end, cycle_time))
+    return status, boundary - t
+
+
+def phase_windows(timestamps, count, cycle_time=DEFAULT_CYCLE, green=DEFAULT_GREEN,
+                  red=DEFAULT_RED, offset=0.0):
+    """Return the current and next `count - 1` phase windows per timestamp.
+
+    Output arrays have shape `timestamps.shape + (count,)`: status codes plus
+    absolute window start and end times. The first window is the phase in
+    progress, so its start lies at or before the timestamp.
+    """
+    t = np.asarray(timestamps, dtype=np.float64)
+    status, to_change = compute_phases(t, cycle_time, green, red, offset)
+
+    amber = np.subtract(cycle_time, np.add(green, red))
+    durations = np.stack(
+        [np.broadcast_to(np.asarray(d, dtype=np.float64), t.shape) for d in (green, red, amber)],
+        axis=-1,
+    )
+
+    codes = (status[..., None] + np.arange(count)) % 3
+    lengths = np.take_along_axis(durations, codes.astype(np.intp), axis=-1)
+
+    ends = np.empty(codes.shape, dtype=np.float64)
+    ends[..., 0] = t + to_change
+    ends[..., 1:] = ends[..., :1] + np.cumsum(lengths[..., 1:], axis=-1)
+    starts = ends - lengths
+    return codes.astype(np.int8), starts, ends
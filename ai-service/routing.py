@@ -0,0 +1,328 @@
+"""
+Time-dependent routing over the junction graph.
+
+Nodes are registry rows. Edges come from a road edge list when one is
+configured; otherwise each junction is linked to its nearest neighbours,
+with straight-line lengths stretched by a detour factor. The graph is
+stored in CSR form and cached on disk, keyed by junction positions and
+build settings, so a restart or another worker loads it instead of
+rebuilding it.
+
+Search is time-dependent Dijkstra. Leaving a junction costs the wait for
+its next green, from the same plan rows the phase predictor uses, and
+driving an edge costs length / cruise speed. Waiting for green keeps
+first-in-first-out order, so the earliest-arrival labels stay exact. A
+bulk request is grouped by (origin, departure): one one-to-all search
+answers every destination in its group. The groups can be spread over a
+process pool whose workers receive the graph once, when they start.
+
+Searches run on plain Python lists (faster to index than NumPy scalars),
+converted once per graph and once per bulk call rather than per search,
+and keep their labels in dicts, so a short trip only pays for the part of
+the graph it explores.
+"""
+import hashlib
+import heapq
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from advisory import haversine
+
+CRUISE_SPEED = 30 / 3.6  # m/s
+NEIGHBOURS = 4
+MAX_EDGE = 2000.0  # metres
+DETOUR = 1.3  # road length per straight-line metre
+BUILD_CHUNK = 1024
+
+
+class RoadGraph:
+    def __init__(self, n, sources, targets, lengths):
+        sources = np.asarray(sources, dtype=np.int64)
+        order = np.argsort(sources, kind="stable")
+        self.n = n
+        self.indptr = np.searchsorted(sources[order], np.arange(n + 1)).astype(np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)[order]
+        self.lengths = np.asarray(lengths, dtype=np.float64)[order]
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    def adjacency(self, speed=CRUISE_SPEED):
+        """CSR arrays as lists (indptr, targets, lengths, travel seconds), built once per speed."""
+        cache = self.__dict__.setdefault("_adjacency", {})
+        if speed not in cache:
+            cache[speed] = (self.indptr.tolist(), self.targets.tolist(), self.lengths.tolist(),
+                            (self.lengths / speed).tolist())
+        return cache[speed]
+
+    def __getstate__(self):
+        # Pool workers rebuild the lists themselves rather than unpickling them
+        state = dict(self.__dict__)
+        state.pop("_adjacency", None)
+        return state
+
+    @classmethod
+    def nearest_neighbours(cls, lats, lngs, k=NEIGHBOURS, max_edge=MAX_EDGE, detour=DETOUR):
+        """Link every located junction to its k nearest neighbours within max_edge, both ways."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        n = len(lats)
+        located = np.flatnonzero(~(np.isnan(lats) | np.isnan(lngs)))
+        k = min(k, len(located) - 1)
+        sources, targets, lengths = [], [], []
+        if k > 0:
+            for chunk in range(0, len(located), BUILD_CHUNK):
+                rows = located[chunk:chunk + BUILD_CHUNK]
+                d = haversine(lats[rows, None], lngs[rows, None], lats[located], lngs[located])
+                d[np.arange(len(rows)), np.arange(chunk, chunk + len(rows))] = np.inf
+                nearest = np.argpartition(d, k - 1, axis=1)[:, :k]
+                dist = np.take_along_axis(d, nearest, axis=1)
+                keep = dist <= max_edge
+                sources.append(np.repeat(rows, k)[keep.ravel()])
+                targets.append(located[nearest][keep])
+                lengths.append(dist[keep] * detour)
+        if not sources:
+            return cls(n, [], [], [])
+        sources, targets, lengths = map(np.concatenate, (sources, targets, lengths))
+        # Roads run both ways; keep each directed pair once
+        both = np.concatenate([np.column_stack([sources, targets]), np.column_stack([targets, sources])])
+        pairs, first = np.unique(both, axis=0, return_index=True)
+        return cls(n, pairs[:, 0], pairs[:, 1], np.concatenate([lengths, lengths])[first])
+
+    @classmethod
+    def from_edges(cls, registry, edges, detour=DETOUR):
+        """Edges are {"from", "to", "length" (optional, metres), "oneway" (optional)} records."""
+        plans = registry.plans
+        sources, targets, lengths = [], [], []
+        for edge in edges:
+            u, v = registry.row(edge["from"]), registry.row(edge["to"])
+            if u < 0 or v < 0:
+                raise ValueError(f"edge {edge['from']} -> {edge['to']} names an unknown junction")
+            length = edge.get("length")
+            if length is None:
+                length = detour * float(haversine(plans["lat"][u], plans["lng"][u], plans["lat"][v], plans["lng"][v]))
+            pairs = [(u, v)] if edge.get("oneway") else [(u, v), (v, u)]
+            for a, b in pairs:
+                sources.append(a)
+                targets.append(b)
+                lengths.append(float(length))
+        return cls(len(registry), sources, targets, lengths)
+
+    def save(self, path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, n=self.n, indptr=self.indptr, targets=self.targets, lengths=self.lengths)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            graph = cls.__new__(cls)
+            graph.n = int(data["n"])
+            graph.indptr = data["indptr"]
+            graph.targets = data["targets"]
+            graph.lengths = data["lengths"]
+        return graph
+
+
+def cached_graph(registry, cache_dir=None, edges_path=None, k=NEIGHBOURS, max_edge=MAX_EDGE, detour=DETOUR):
+    """Load the road graph for `registry` from the on-disk cache, building it on a miss."""
+    edges_path = edges_path or os.environ.get("GLOSA_ROAD_EDGES_PATH")
+    cache_dir = cache_dir or os.environ.get("GLOSA_GRAPH_CACHE_DIR",
+                                            os.path.join(tempfile.gettempdir(), "glosa-graphs"))
+    plans = registry.plans[:len(registry)]
+    key = hashlib.sha1()
+    key.update("\0".join(registry.ids).encode())
+    key.update(np.ascontiguousarray(plans[["lat", "lng"]]).tobytes())
+    key.update(repr((k, max_edge, detour)).encode())
+    if edges_path:
+        with open(edges_path, "rb") as f:
+            key.update(f.read())
+    path = os.path.join(cache_dir, f"road_graph_{key.hexdigest()[:16]}.npz")
+    if os.path.exists(path):
+        return RoadGraph.load(path)
+
+    if edges_path:
+        with open(edges_path) as f:
+            graph = RoadGraph.from_edges(registry, json.load(f), detour)
+    else:
+        graph = RoadGraph.nearest_neighbours(plans["lat"], plans["lng"], k, max_edge, detour)
+    os.makedirs(cache_dir, exist_ok=True)
+    graph.save(path)
+    return graph
+
+
+def signal_timing(plans):
+    """Plan columns the search reads, as lists (cycle, green, offset)."""
+    return plans["cycle_time"].tolist(), plans["green"].tolist(), plans["offset"].tolist()
+
+
+def _search(adjacency, timing, origin, departure, destinations=None):
+    # Labels are dicts over the nodes reached so far: (arrival, parent, wait, distance)
+    indptr, targets, lengths, travel = adjacency
+    cycle, green, offset = timing
+    arrival = {origin: departure}
+    parent = {origin: -1}
+    waits = {}
+    distance = {origin: 0.0}
+    settled = set()
+    remaining = None if destinations is None else set(destinations)
+    heap = [(departure, origin)]
+    inf = float("inf")
+    while heap:
+        t, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        settled.add(u)
+        if remaining is not None:
+            remaining.discard(u)
+            if not remaining:
+                break
+        phase = (t - offset[u]) % cycle[u]
+        wait = 0.0 if phase < green[u] else cycle[u] - phase
+        waits[u] = wait
+        leave = t + wait
+        for e in range(indptr[u], indptr[u + 1]):
+            v = targets[e]
+            reach = leave + travel[e]
+            if reach < arrival.get(v, inf):
+                arrival[v] = reach
+                parent[v] = u
+                distance[v] = distance[u] + lengths[e]
+                heapq.heappush(heap, (reach, v))
+    return arrival, parent, waits, distance
+
+
+def earliest_arrivals(graph, plans, origin, departure, destinations=None, speed=CRUISE_SPEED):
+    """Time-dependent Dijkstra from `origin` at `departure`.
+
+    Returns (arrival times, predecessor rows, wait before leaving each
+    node, road distance) as arrays over all nodes; unreachable nodes
+    arrive at inf. Stops early once every row in `destinations` is settled.
+    """
+    labels = _search(graph.adjacency(speed), signal_timing(plans), origin, departure, destinations)
+    arrays = []
+    for label, fill, dtype in zip(labels, (np.inf, -1, 0.0, 0.0), (np.float64, np.int64, np.float64, np.float64)):
+        array = np.full(graph.n, fill, dtype=dtype)
+        if label:
+            array[np.fromiter(label.keys(), np.int64, len(label))] = np.fromiter(label.values(), dtype, len(label))
+        arrays.append(array)
+    return tuple(arrays)
+
+
+def _route_group(adjacency, timing, origin, departure, destinations):
+    arrival, parent, waits, distance = _search(adjacency, timing, origin, departure, destinations)
+    routes = []
+    for destination in destinations:
+        if destination not in arrival:
+            routes.append(None)
+            continue
+        path = [destination]
+        while path[-1] != origin:
+            path.append(parent[path[-1]])
+        path.reverse()
+        # The destination is reached, not crossed, so its own wait does not count
+        crossed = [waits[u] for u in path[:-1]]
+        routes.append({
+            "path": path,
+            "travel_time": arrival[destination] - departure,
+            "distance": distance[destination],
+            "signal_wait": sum(crossed),
+            "stops": sum(1 for wait in crossed if wait > 0),
+        })
+    return routes
+
+
+_worker_graph = None
+
+
+def _init_worker(graph):
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _route_chunk(args):
+    timing, groups, speed = args
+    adjacency = _worker_graph.adjacency(speed)
+    return [_route_group(adjacency, timing, *group) for group in groups]
+
+
+def routing_pool(graph, workers=None):
+    """Process pool whose workers hold `graph`; pass it to route_many as `executor`."""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(graph,))
+
+
+def route_many(graph, plans, origins, destinations, departures, speed=CRUISE_SPEED, executor=None):
+    """Route every (origin, destination, departure) triple; rows in, route dicts (or None) out."""
+    groups = {}
+    for i, (origin, destination, departure) in enumerate(zip(origins, destinations, departures)):
+        groups.setdefault((int(origin), float(departure)), []).append((i, int(destination)))
+    keys = list(groups)
+    work = [(origin, departure, [d for _, d in groups[(origin, departure)]]) for origin, departure in keys]
+
+    timing = signal_timing(plans)
+    if executor is None or len(work) < 2:
+        adjacency = graph.adjacency(speed)
+        results = [_route_group(adjacency, timing, *group) for group in work]
+    else:
+        workers = getattr(executor, "_max_workers", os.cpu_count() or 1)
+        size = max(1, -(-len(work) // (4 * workers)))
+        chunks = [work[i:i + size] for i in range(0, len(work), size)]
+        results = [routes for chunk in executor.map(_route_chunk, [(timing, c, speed) for c in chunks])
+                   for routes in chunk]
+
+    routes = [None] * len(origins)
+    for key, group_routes in zip(keys, results):
+        for (i, _), route in zip(groups[key], group_routes):
+            routes[i] = route
+    return routes
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from signal_plans import SignalPlanRegistry, PLAN_DTYPE
+
+    parser = argparse.ArgumentParser(description="Benchmark bulk routing on a synthetic city grid.")
+    parser.add_argument("--junctions", type=int, default=2500)
+    parser.add_argument("--pairs", type=int, default=2000)
+    parser.add_argument("--origins", type=int, default=200, help="distinct origins among the pairs")
+    parser.add_argument("--workers", type=int, default=0, help="process pool size (0: inline)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    side = int(np.ceil(np.sqrt(args.junctions)))
+    ids = [f"G{i}" for i in range(args.junctions)]
+    plans = np.zeros(args.junctions, dtype=PLAN_DTYPE)
+    plans["cycle_time"] = rng.choice([60, 90, 120], args.junctions)
+    plans["green"] = plans["cycle_time"] * rng.uniform(0.35, 0.55, args.junctions)
+    plans["red"] = plans["cycle_time"] - plans["green"] - 5
+    plans["offset"] = rng.uniform(0, plans["cycle_time"])
+    # ~400 m blocks around central Delhi
+    plans["lat"] = 28.6 + (np.arange(args.junctions) // side) * 0.0036
+    plans["lng"] = 77.2 + (np.arange(args.junctions) % side) * 0.0041
+    registry = SignalPlanRegistry(ids, plans)
+
+    start = time.perf_counter()
+    graph = cached_graph(registry)
+    print(f"graph: {graph.n} nodes, {graph.edge_count} edges in {time.perf_counter() - start:.2f}s")
+
+    origins = rng.integers(0, args.junctions, args.origins)[rng.integers(0, args.origins, args.pairs)]
+    destinations = rng.integers(0, args.junctions, args.pairs)
+    departures = np.full(args.pairs, 1.7e9)
+    executor = routing_pool(graph, args.workers) if args.workers else None
+    start = time.perf_counter()
+    routes = route_many(graph, registry.plans, origins, destinations, departures, executor=executor)
+    elapsed = time.perf_counter() - start
+    if executor is not None:
+        executor.shutdown()
+    found = [r for r in routes if r is not None]
+    print(f"{args.pairs} pairs in {elapsed:.2f}s ({1e3 * elapsed / args.pairs:.2f} ms/pair), "
+          f"mean travel {np.mean([r['travel_time'] for r in found]):.0f}s, "
+          f"mean signal wait {np.mean([r['signal_wait'] for r in found]):.0f}s")
@@ -0,0 +1,221 @@
+"""
+Junction state table shared by every worker process on a node.
+
+All mutable per-junction state (signal plans including learned offsets,
+queue densities, estimator state) lives in one fixed-layout block: a small
+header followed by one array per field, each with a row per registry
+junction plus the spare default row. With GLOSA_SHARED_STATE set the block is
+a POSIX shared-memory segment that every uvicorn worker maps, so workers
+read the same arrays in place instead of holding private copies; without it
+the same layout sits in private memory.
+
+Consistency is a seqlock. Writers take an exclusive lock (a thread lock plus
+an flock across processes), so there is one writer at a time; they bump the
+sequence to odd, write, and bump it back to even. Readers run their gather,
+then retry if the sequence was odd or moved in the meantime. Sequence
+updates rely on the ordered stores of x86-64, where these services run.
+
+Every row also carries a version counter that writers bump (touch) when
+they change the row. Workers keep private caches derived from the table
+(prediction windows); an entry remembers the version it was computed at and
+is dropped once the row has moved on, whichever worker wrote it.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+HEADER_DTYPE = np.dtype([("ready", "<u8"), ("sequence", "<u8"),
+                         ("fingerprint", "<u8"), ("rows", "<u8")])
+HEADER_BYTES = 64
+READY = 0x474C4F5341524459  # "GLOSARDY"
+ALIGN = 64
+ATTACH_TIMEOUT = 10.0
+READ_RETRIES = 64
+
+
+def allocate(fields, rows):
+    """Private arrays for (name, dtype, item shape, fill) field specs."""
+    state = {}
+    for name, dtype, shape, fill in fields:
+        state[name] = np.full((rows,) + tuple(shape), fill, dtype=dtype)
+    return state
+
+
+def _layout(fields, rows):
+    offsets, offset = {}, HEADER_BYTES
+    for name, dtype, shape, _ in fields:
+        offsets[name] = offset
+        size = rows * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+        offset += -(-size // ALIGN) * ALIGN
+    return offsets, offset
+
+
+def _fingerprint(fields, junction_ids):
+    digest = hashlib.blake2b(digest_size=8)
+    for name, dtype, shape, _ in fields:
+        digest.update(f"{name}:{np.dtype(dtype).descr}:{tuple(shape)};".encode())
+    for junction_id in junction_ids:
+        digest.update(junction_id.encode() + b"\0")
+    return int.from_bytes(digest.digest(), "little")
+
+
+class JunctionStateTable:
+    def __init__(self, registry, fields, name=None):
+        # The plans array always comes first (the registry reads it in place),
+        # then the per-row versions
+        self.fields = [("plans", registry.plans.dtype, (), 0), ("version", np.uint64, (), 0)]
+        self.fields += list(fields)
+        self.rows = len(registry) + 1
+        self.name = name
+        offsets, size = _layout(self.fields, self.rows)
+        fingerprint = _fingerprint(self.fields, registry.ids)
+
+        self._shm = None
+        self._lock_file = None
+        if name is None:
+            self.created = True
+            buffer = memoryview(bytearray(size))
+        else:
+            self._shm, self.created = self._open_segment(name, size)
+            buffer = self._shm.buf
+            self._lock_file = open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), "a+b")
+        self._thread_lock = threading.Lock()
+
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=buffer)
+        self.arrays = {
+            field: np.ndarray((self.rows,) + tuple(shape), dtype=dtype, buffer=buffer, offset=offsets[field])
+            for field, dtype, shape, _ in self.fields
+        }
+
+        if self.created:
+            self.arrays["plans"][:] = registry.plans
+            for field, _, _, fill in self.fields[1:]:
+                self.arrays[field][...] = fill
+            self.header["fingerprint"] = fingerprint
+            self.header["rows"] = self.rows
+            self.header["sequence"] = 0
+            # Published last: attaching workers wait for it
+            self.header["ready"] = READY
+        else:
+            self._wait_ready()
+            if int(self.header["fingerprint"]) != fingerprint:
+                raise RuntimeError(
+                    f"shared state {name!r} was built for different junctions or layout; "
+                    f"stop all workers and run `python shared_state.py --unlink {name}`"
+                )
+        registry.plans = self.arrays["plans"]
+
+    @staticmethod
+    def _open_segment(name, size):
+        # Segments outlive any one worker: a restarted worker re-attaches, and
+        # the segment is removed explicitly (see --unlink) rather than by the
+        # resource tracker when its creator exits
+        from multiprocessing import resource_tracker
+
+        deadline = time.monotonic() + ATTACH_TIMEOUT
+        while True:
+            try:
+                shm, created = shared_memory.SharedMemory(name=name, create=True, size=size), True
+            except FileExistsError:
+                try:
+                    shm, created = shared_memory.SharedMemory(name=name), False
+                except (FileNotFoundError, ValueError):
+                    # Creator is between shm_open and ftruncate, or just unlinked
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.01)
+                    continue
+                if shm.size < size:
+                    shm.close()
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"shared state {name!r} is smaller than this layout")
+                    time.sleep(0.01)
+                    continue
+            resource_tracker.unregister(shm._name, "shared_memory")
+            return shm, created
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + ATTACH_TIMEOUT
+        while int(self.header["ready"]) != READY:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"shared state {self.name!r} was never initialized")
+            time.sleep(0.01)
+
+    def __getitem__(self, field):
+        return self.arrays[field]
+
+    def view(self, fields):
+        return {field: self.arrays[field] for field in fields}
+
+    @contextmanager
+    def _exclusive(self):
+        with self._thread_lock:
+            if self._lock_file is None:
+                yield
+                return
+            import fcntl
+
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def write(self):
+        with self._exclusive():
+            self.header["sequence"] += 1
+            try:
+                yield
+            finally:
+                self.header["sequence"] += 1
+
+    def touch(self, rows):
+        """Bump the version of changed rows; call inside write()."""
+        self.arrays["version"][rows] += 1
+
+    def version(self, row):
+        return int(self.arrays["version"][row])
+
+    def read(self, gather):
+        """Run gather() against a state no writer touched meanwhile."""
+        header = self.header
+        for _ in range(READ_RETRIES):
+            before = int(header["sequence"])
+            if before & 1:
+                continue
+            result = gather()
+            if int(header["sequence"]) == before:
+                return result
+        # Persistent write traffic: read under the writer lock instead
+        with self._exclusive():
+            return gather()
+
+    def close(self):
+        self.arrays = {}
+        self.header = None
+        if self._shm is not None:
+            self._shm.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+
+def unlink(name):
+    shm = shared_memory.SharedMemory(name=name)
+    shm.close()
+    shm.unlink()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the shared junction state segment.")
+    parser.add_argument("--unlink", metavar="NAME", required=True,
+                        help="remove the segment once every worker has stopped")
+    unlink(parser.parse_args().unlink)
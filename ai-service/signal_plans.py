@@ -0,0 +1,101 @@
+"""
+Per-junction signal plan registry.
+
+Plans live in a single NumPy structured array with a dict from junction ID
+to row, so a lookup is one hash probe and 100k junctions cost a few MB.
+The last row always holds the default plan: unknown junctions resolve to
+row -1 and therefore fall back to it without any special casing.
+"""
+import json
+import os
+
+import numpy as np
+
+from phases import DEFAULT_CYCLE, DEFAULT_GREEN, DEFAULT_RED
+
+PLAN_DTYPE = np.dtype([
+    # float64: these are combined with epoch-second timestamps, where float32
+    # rounding of e.g. a 90.3 s cycle shifts the phase by tens of seconds
+    ("cycle_time", "f8"),
+    ("green", "f8"),
+    ("red", "f8"),
+    ("offset", "f8"),
+    ("lat", "f8"),
+    ("lng", "f8"),
+])
+
+DEFAULT_JUNCTIONS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "backend", "data", "junctions.json"
+)
+
+
+def default_plan():
+    plan = np.zeros((), dtype=PLAN_DTYPE)
+    plan["cycle_time"] = DEFAULT_CYCLE
+    plan["green"] = DEFAULT_GREEN
+    plan["red"] = DEFAULT_RED
+    plan["lat"] = plan["lng"] = np.nan
+    return plan
+
+
+class SignalPlanRegistry:
+    def __init__(self, ids, plans):
+        if len(ids) != len(plans):
+            raise ValueError("ids and plans must have the same length")
+        self.ids = list(ids)
+        self.index = {junction_id: row for row, junction_id in enumerate(self.ids)}
+        if len(self.index) != len(self.ids):
+            raise ValueError("duplicate junction ids in signal plans")
+        self.plans = np.empty(len(self.ids) + 1, dtype=PLAN_DTYPE)
+        self.plans[:-1] = plans
+        self.plans[-1] = default_plan()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, junction_id):
+        return self.index.get(junction_id, -1)
+
+    def rows(self, junction_ids):
+        get = self.index.get
+        return np.fromiter((get(j, -1) for j in junction_ids), dtype=np.intp,
+                           count=len(junction_ids))
+
+    def plan(self, junction_id):
+        return self.plans[self.row(junction_id)]
+
+    def lookup(self, junction_ids):
+        """Plans for many junctions at once, as a structured array."""
+        return self.plans[self.rows(junction_ids)]
+
+    @classmethod
+    def from_records(cls, records):
+        """Build from dicts shaped like backend/data/junctions.json entries.
+
+        `green`, `red` and `offset` are optional; missing splits keep the
+        default 30/25/5 proportions scaled to the junction's cycle_time.
+        """
+        plans = np.empty(len(records), dtype=PLAN_DTYPE)
+        for row, record in enumerate(records):
+            cycle = float(record.get("cycle_time", DEFAULT_CYCLE))
+            scale = cycle / DEFAULT_CYCLE
+            green = float(record.get("green", DEFAULT_GREEN * scale))
+            red = float(record.get("red", DEFAULT_RED * scale))
+            if green <= 0 or red <= 0 or green + red >= cycle:
+                raise ValueError(f"invalid signal plan for junction {record['id']}")
+            plans[row] = (cycle, green, red, float(record.get("offset", 0.0)) % cycle,
+                          record.get("lat", np.nan), record.get("lng", np.nan))
+        return cls([record["id"] for record in records], plans)
+
+    @classmethod
+    def from_json(cls, path):
+        if not os.path.exists(path):
+            return cls([], np.empty(0, dtype=PLAN_DTYPE))
+        with open(path) as f:
+            return cls.from_records(json.load(f))
+
+
+def load_registry(path=None):
+    return SignalPlanRegistry.from_json(
+        path or os.environ.get("GLOSA_JUNCTIONS_PATH", DEFAULT_JUNCTIONS_PATH)
+    )
@@ -0,0 +1,262 @@
+"""
+Discrete-time traffic simulator for evaluating advisory policies.
+
+Every vehicle is a row in a handful of NumPy arrays (route, position,
+speed, next junction), and one step advances all of them at once. Vehicles
+drive fixed routes, each an ordered list of junctions with stop lines
+along a single lane:
+
+- longitudinal control is the Intelligent Driver Model, following the
+  vehicle ahead on the same route;
+- a signal that is not green becomes a stationary obstacle at its stop
+  line, unless the vehicle can no longer stop in time (it then crosses,
+  counted as a red crossing in RED and as a pre-green crossing in AMBER,
+  which here precedes green: both are violations, reported apart because
+  a pre-green crossing only jumps the start of the next green);
+- signals follow their fixed-time plans. With the "glosa" policy, vehicles
+  within ADVISORY_RANGE of the next junction cap their desired speed at
+  calculate_advisory's recommendation. "Maintain speed" is read as keep
+  going (its speed is only the minimum that clears the green) and "Stop"
+  is left to the signal obstacle. The advisory is computed from the
+  active phase model's prediction, the same path the service uses.
+
+Reported per policy: stops per vehicle, mean delay over free flow,
+throughput, mean speed, and red and pre-green crossings. Both policies see the
+same network and demand, so they can be compared in CI:
+
+    python simulate.py --vehicles 20000 --routes 400 --duration 1800
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from advisory import MAINTAIN, STOP, calculate_advisory
+from models import ScheduleModel, build_features
+from phases import AMBER, GREEN, RED, compute_phases
+from signal_plans import PLAN_DTYPE
+
+STEP = 0.5  # seconds
+FREE_SPEED = 50 / 3.6  # m/s
+ADVISORY_RANGE = 500.0  # metres before the stop line
+
+# Intelligent Driver Model parameters
+MAX_ACCEL = 1.5  # m/s^2
+COMFORT_DECEL = 2.0  # m/s^2
+MAX_DECEL = 6.0  # m/s^2; beyond this a vehicle cannot stop for a signal
+MIN_GAP = 2.0  # metres
+HEADWAY = 1.2  # seconds
+VEHICLE_LENGTH = 5.0  # metres
+STOPPED_SPEED = 0.5  # m/s
+
+
+class Network:
+    """Routes as padded (routes, junctions) arrays of plan rows and stop-line positions."""
+
+    def __init__(self, plans, route_rows, stop_lines, lengths):
+        self.plans = plans
+        self.route_rows = np.asarray(route_rows, dtype=np.intp)
+        self.stop_lines = np.asarray(stop_lines, dtype=np.float64)
+        self.lengths = np.asarray(lengths, dtype=np.float64)
+
+    @classmethod
+    def synthetic(cls, routes, junctions_per_route, seed=0):
+        """Independent arterials with random spacing and fixed-time plans."""
+        rng = np.random.default_rng(seed)
+        n = routes * junctions_per_route
+        plans = np.zeros(n, dtype=PLAN_DTYPE)
+        plans["cycle_time"] = rng.choice([60, 90, 120], n)
+        plans["green"] = np.round(plans["cycle_time"] * rng.uniform(0.35, 0.55, n))
+        plans["red"] = plans["cycle_time"] - plans["green"] - 4
+        plans["offset"] = np.round(rng.uniform(0, plans["cycle_time"]))
+        rows = np.arange(n).reshape(routes, junctions_per_route)
+        stop_lines = np.cumsum(rng.uniform(250, 800, (routes, junctions_per_route)), axis=1)
+        lengths = stop_lines[:, -1] + 200.0
+        return cls(plans, rows, stop_lines, lengths)
+
+
+class Simulator:
+    def __init__(self, network, vehicles, demand_window, policy="none", model=None, step=STEP, seed=0):
+        self.network = network
+        self.policy = policy
+        self.model = model or ScheduleModel()
+        self.step = step
+        rng = np.random.default_rng(seed)
+
+        routes = len(network.lengths)
+        self.route = rng.integers(0, routes, vehicles)
+        self.entry_time = np.sort(rng.uniform(0, demand_window, vehicles))
+        self.position = np.zeros(vehicles)
+        self.speed = np.zeros(vehicles)
+        self.target = np.zeros(vehicles, dtype=np.intp)  # index of the next junction on the route
+        self.active = np.zeros(vehicles, dtype=bool)
+        self.done = np.zeros(vehicles, dtype=bool)
+        self.entered = np.full(vehicles, np.nan)
+        self.finished = np.full(vehicles, np.nan)
+        self.stops = np.zeros(vehicles, dtype=np.int32)
+        self.red_crossings = 0
+        self.pre_green_crossings = 0  # AMBER runs before GREEN, so these are violations too
+        self.time = 0.0
+        # observe(time, vehicle indices, speed, acceleration) is called after every step
+        self.observers = []
+
+    def _admit(self):
+        # At most one vehicle enters each route per step, and only if the entry is clear
+        waiting = np.flatnonzero(~self.active & ~self.done & (self.entry_time <= self.time))
+        if not len(waiting):
+            return
+        routes, first = np.unique(self.route[waiting], return_index=True)
+        candidates = waiting[first]
+        on_road = np.flatnonzero(self.active)
+        last = np.full(len(self.network.lengths), np.inf)
+        np.minimum.at(last, self.route[on_road], self.position[on_road])
+        clear = last[routes] >= VEHICLE_LENGTH + MIN_GAP + FREE_SPEED * HEADWAY
+        admitted = candidates[clear]
+        self.active[admitted] = True
+        self.speed[admitted] = FREE_SPEED
+        self.entered[admitted] = self.time
+
+    def _leader_gaps(self, idx):
+        # Vehicles sorted by (route, position); each one's leader is the next one on its route
+        order = idx[np.lexsort((self.position[idx], self.route[idx]))]
+        gap = np.full(len(order), np.inf)
+        leader_speed = np.zeros(len(order))
+        same = self.route[order[1:]] == self.route[order[:-1]]
+        gap[:-1][same] = self.position[order[1:]][same] - self.position[order[:-1]][same] - VEHICLE_LENGTH
+        leader_speed[:-1][same] = self.speed[order[1:]][same]
+        return order, gap, leader_speed
+
+    def step_once(self):
+        self._admit()
+        idx = np.flatnonzero(self.active)
+        if not len(idx):
+            self.time += self.step
+            return
+        network = self.network
+        idx, gap, leader_speed = self._leader_gaps(idx)
+        v = self.speed[idx]
+        route = self.route[idx]
+        k = self.target[idx]
+        has_signal = k < network.route_rows.shape[1]
+        k_safe = np.minimum(k, network.route_rows.shape[1] - 1)
+        rows = network.route_rows[route, k_safe]
+        plans = network.plans[rows]
+        to_line = np.where(has_signal, network.stop_lines[route, k_safe] - self.position[idx], np.inf)
+
+        status, _ = compute_phases(self.time, plans["cycle_time"], plans["green"], plans["red"], plans["offset"])
+        desired = np.full(len(idx), FREE_SPEED)
+        if self.policy == "glosa":
+            near = has_signal & (to_line <= ADVISORY_RANGE)
+            if near.any():
+                predicted, to_change = self.model.predict(
+                    build_features(plans[near], np.full(int(near.sum()), self.time)))
+                advised, message = calculate_advisory(to_line[near], np.round(to_change, 1), predicted)
+                follow = (message != MAINTAIN) & (message != STOP)
+                desired[near] = np.where(follow, np.minimum(advised / 3.6, FREE_SPEED), FREE_SPEED)
+
+        # A signal that is not green is a stopped obstacle, unless it is too late to brake for it
+        must_stop = has_signal & (status != GREEN) & (to_line > 0)
+        can_stop = v * v <= 2 * MAX_DECEL * np.maximum(to_line, 1e-3)
+        obstacle = must_stop & can_stop
+        gap = np.where(obstacle & (to_line < gap), to_line, gap)
+        leader_speed = np.where(obstacle & (to_line <= gap), 0.0, leader_speed)
+
+        desired_gap = MIN_GAP + v * HEADWAY + v * (v - leader_speed) / (2 * np.sqrt(MAX_ACCEL * COMFORT_DECEL))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            interaction = np.where(np.isfinite(gap), (np.maximum(desired_gap, 0) / np.maximum(gap, 0.1)) ** 2, 0.0)
+        accel = MAX_ACCEL * (1 - (v / desired) ** 4 - interaction)
+        accel = np.maximum(accel, -2 * MAX_DECEL)
+
+        new_v = np.maximum(v + accel * self.step, 0.0)
+        # Kinematics with the average speed over the step (no reversing)
+        moved = 0.5 * (v + new_v) * self.step
+        position = self.position[idx] + moved
+
+        # Crossing a stop line moves the target on; red and pre-green crossings are counted once
+        crossed = has_signal & (position >= network.stop_lines[route, k_safe])
+        self.red_crossings += int((crossed & (status == RED)).sum())
+        self.pre_green_crossings += int((crossed & (status == AMBER)).sum())
+        k = k + crossed
+        self.stops[idx] += (new_v < STOPPED_SPEED) & (v >= STOPPED_SPEED)
+
+        for observe in self.observers:
+            observe(self.time, idx, new_v, (new_v - v) / self.step)
+
+        self.position[idx] = position
+        self.speed[idx] = new_v
+        self.target[idx] = k
+        finished = position >= network.lengths[route]
+        done = idx[finished]
+        self.active[done] = False
+        self.done[done] = True
+        self.finished[done] = self.time + self.step
+        self.time += self.step
+
+    def run(self, duration):
+        steps = int(round(duration / self.step))
+        for _ in range(steps):
+            self.step_once()
+        return self.report(duration)
+
+    def report(self, duration):
+        done = self.done
+        lengths = self.network.lengths[self.route[done]]
+        travel = self.finished[done] - self.entered[done]
+        entered = ~np.isnan(self.entered)
+        return {
+            "policy": self.policy,
+            "vehicles_entered": int(entered.sum()),
+            "vehicles_finished": int(done.sum()),
+            "throughput_per_hour": float(done.sum() * 3600 / duration),
+            "stops_per_vehicle": float(self.stops[done].mean()) if done.any() else 0.0,
+            "mean_delay": float((travel - lengths / FREE_SPEED).mean()) if done.any() else 0.0,
+            "mean_speed_kmh": float((lengths / travel).mean() * 3.6) if done.any() else 0.0,
+            "red_crossings": self.red_crossings,
+            "pre_green_crossings": self.pre_green_crossings,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate traffic with and without GLOSA advisories.")
+    parser.add_argument("--vehicles", type=int, default=20000)
+    parser.add_argument("--routes", type=int, default=400)
+    parser.add_argument("--junctions", type=int, default=6, help="junctions per route")
+    parser.add_argument("--duration", type=float, default=1800.0, help="simulated seconds")
+    parser.add_argument("--demand", type=float, default=None,
+                        help="seconds over which vehicles enter (default: 2/3 of the duration)")
+    parser.add_argument("--policy", choices=("none", "glosa", "both"), default="both")
+    parser.add_argument("--model", default="schedule", help="phase model the advisory uses")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the reports as JSON")
+    args = parser.parse_args()
+
+    model = None
+    if args.model != "schedule":
+        from models import default_registry
+
+        model = default_registry().load(args.model)
+    network = Network.synthetic(args.routes, args.junctions, args.seed)
+    demand = args.demand if args.demand is not None else args.duration * 2 / 3
+    policies = ("none", "glosa") if args.policy == "both" else (args.policy,)
+    reports = []
+    for policy in policies:
+        sim = Simulator(network, args.vehicles, demand, policy, model=model, seed=args.seed)
+        start = time.perf_counter()
+        report = sim.run(args.duration)
+        elapsed = time.perf_counter() - start
+        report["wall_seconds"] = elapsed
+        report["speedup"] = args.duration / elapsed
+        reports.append(report)
+        print(f"{policy:<6} finished {report['vehicles_finished']:6d}/{report['vehicles_entered']:<6d} "
+              f"stops/veh {report['stops_per_vehicle']:5.2f}  delay {report['mean_delay']:6.1f}s  "
+              f"speed {report['mean_speed_kmh']:5.1f} km/h  {report['throughput_per_hour']:8.0f} veh/h  "
+              f"red/pre-green crossings {report['red_crossings']}/{report['pre_green_crossings']}  "
+              f"({report['speedup']:.0f}x real time)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Single-flight coalescing for identical in-flight predictions.
+
+Concurrent callers asking for the same key (junction and time bucket) share
+the first caller's computation instead of each invoking the predictor.
+"""
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.deduplicated = 0
+
+    @property
+    def inflight(self):
+        return len(self._inflight)
+
+    async def do(self, key, compute):
+        """Await compute() once per key at a time and share its result."""
+        self.calls += 1
+        future = self._inflight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+            # shield: one caller disconnecting must not cancel the others
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(compute())
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "deduplicated": self.deduplicated,
+            "inflight": self.inflight,
+        }
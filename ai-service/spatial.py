@@ -0,0 +1,138 @@
+"""
+Uniform geo-grid over junction positions for bulk nearest-junction lookup.
+
+Junctions are bucketed into square cells on a local equirectangular
+projection. A query only inspects the cells within its search radius, found
+by binary search over the sorted cell keys, so the cost per ping depends on
+local junction density rather than on the size of the registry. Candidate
+distances are exact haversine distances.
+"""
+import numpy as np
+
+from advisory import EARTH_RADIUS, haversine
+
+DEFAULT_CELL_SIZE = 500.0  # metres
+DEFAULT_HEADING_CONE = 60.0  # degrees either side of the heading
+QUERY_CHUNK = 65536
+
+
+def _cell_keys(ix, iy):
+    return (ix << 32) + iy
+
+
+class JunctionGrid:
+    def __init__(self, lats, lngs, rows=None, cell_size=DEFAULT_CELL_SIZE):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        # Registry row of every indexed junction (defaults to its position here)
+        self.rows = np.arange(len(self.lats)) if rows is None else np.asarray(rows)
+        self.cell_size = float(cell_size)
+
+        self._ky = EARTH_RADIUS * np.pi / 180
+        # Scale longitudes at the most poleward junction so projected
+        # distances never exceed true ones and the ring search stays exact
+        lat_ref = min(float(np.abs(self.lats).max(initial=0.0)), 85.0)
+        self._kx = self._ky * np.cos(np.radians(lat_ref))
+
+        keys = self._keys_for(self.lats, self.lngs)
+        order = np.argsort(keys, kind="stable")
+        self.members = order
+        self.cell_keys, self.cell_starts, self.cell_counts = np.unique(
+            keys[order], return_index=True, return_counts=True
+        )
+
+    @classmethod
+    def from_registry(cls, registry, cell_size=DEFAULT_CELL_SIZE):
+        plans = registry.plans[:len(registry)]
+        located = np.flatnonzero(~(np.isnan(plans["lat"]) | np.isnan(plans["lng"])))
+        return cls(plans["lat"][located], plans["lng"][located], rows=located, cell_size=cell_size)
+
+    def _cells(self, lats, lngs):
+        ix = np.floor(np.asarray(lngs) * self._kx / self.cell_size).astype(np.int64)
+        iy = np.floor(np.asarray(lats) * self._ky / self.cell_size).astype(np.int64)
+        return ix, iy
+
+    def _keys_for(self, lats, lngs):
+        return _cell_keys(*self._cells(lats, lngs))
+
+    def _candidates(self, lats, lngs, rings):
+        ix, iy = self._cells(lats, lngs)
+        span = np.arange(-rings, rings + 1)
+        dx, dy = np.meshgrid(span, span, indexing="ij")
+        keys = _cell_keys(ix[:, None] + dx.ravel(), iy[:, None] + dy.ravel()).ravel()
+
+        pos = np.searchsorted(self.cell_keys, keys)
+        pos = np.minimum(pos, len(self.cell_keys) - 1)
+        found = self.cell_keys[pos] == keys
+        counts = np.where(found, self.cell_counts[pos], 0)
+        starts = np.where(found, self.cell_starts[pos], 0)
+
+        # Expand (start, count) ranges into one flat candidate list
+        total = int(counts.sum())
+        first = np.cumsum(counts) - counts
+        within = np.arange(total) - np.repeat(first, counts)
+        candidates = self.members[np.repeat(starts, counts) + within]
+        query = np.repeat(np.arange(len(keys)) // len(span) ** 2, counts)
+        return query, candidates
+
+    def nearest(self, lats, lngs, headings=None, max_distance=None,
+                cone=DEFAULT_HEADING_CONE):
+        """Nearest (upcoming, if headed) junction for every ping.
+
+        Returns (index into this grid or -1, distance in metres or inf).
+        Pings with a heading only match junctions within `cone` degrees of
+        it, i.e. junctions ahead of the vehicle; NaN headings match any.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lngs = np.atleast_1d(np.asarray(lngs, dtype=np.float64))
+        if headings is not None:
+            headings = np.atleast_1d(np.asarray(headings, dtype=np.float64))
+        max_distance = self.cell_size if max_distance is None else float(max_distance)
+
+        best = np.full(len(lats), -1, dtype=np.int64)
+        best_distance = np.full(len(lats), np.inf)
+        if not len(self.cell_keys):
+            return best, best_distance
+
+        rings = max(int(np.ceil(max_distance / self.cell_size)), 1)
+        for lo in range(0, len(lats), QUERY_CHUNK):
+            hi = min(lo + QUERY_CHUNK, len(lats))
+            query, candidates = self._candidates(lats[lo:hi], lngs[lo:hi], rings)
+            if not len(candidates):
+                continue
+            qlat, qlng = lats[lo:hi][query], lngs[lo:hi][query]
+            clat, clng = self.lats[candidates], self.lngs[candidates]
+
+            # Within a few cells a per-query equirectangular distance ranks
+            # candidates like haversine; the winners get exact distances below
+            east = (clng - qlng) * self._ky * np.cos(np.radians(qlat))
+            north = (clat - qlat) * self._ky
+            distance = np.hypot(east, north)
+
+            rejected = distance > max_distance
+            if headings is not None:
+                heading = headings[lo:hi][query]
+                course = np.degrees(np.arctan2(east, north))
+                off_course = np.abs((course - heading + 180) % 360 - 180)
+                rejected |= off_course > cone  # NaN headings compare False
+            keep = ~rejected
+            query, candidates, distance = query[keep], candidates[keep], distance[keep]
+            if not len(query):
+                continue
+
+            # Candidates arrive grouped by query, so per-query minima are a
+            # single reduceat pass
+            starts = np.flatnonzero(np.r_[True, query[1:] != query[:-1]])
+            group_min = np.minimum.reduceat(distance, starts)
+            sizes = np.diff(np.r_[starts, len(query)])
+            is_min = distance == np.repeat(group_min, sizes)
+            winners = np.flatnonzero(is_min)
+            # Ties keep the first candidate of each query
+            winners = winners[np.r_[True, query[winners][1:] != query[winners][:-1]]]
+
+            target = lo + query[winners]
+            best[target] = candidates[winners]
+            best_distance[target] = haversine(
+                lats[target], lngs[target], self.lats[best[target]], self.lngs[best[target]]
+            )
+        return best, best_distance
@@ -0,0 +1,195 @@
+"""
+Push-based phase change notifications.
+
+One scheduler task keeps a min-heap of the next phase-change deadline for
+every junction that has at least one subscriber. When deadlines fall due it
+recomputes the due junctions in one vectorized pass and appends a message to
+each subscriber's bounded buffer. Subscribers therefore cost a small object
+and a deque, never a timer or coroutine of their own.
+
+Status and countdowns follow the signal plan with live density boundaries
+applied, like /predict, so a held green is reported as green until its
+shifted end and the transition is pushed then. When a junction's state
+version moves (a new or lapsed density sample or a republished plan,
+written by any worker) its deadline is recomputed and subscribers get the
+corrected phase; versions are checked every `refresh` seconds.
+"""
+import asyncio
+import heapq
+import time
+from collections import deque
+
+import numpy as np
+
+from density import apply_boundaries
+from phases import STATUS_LABELS, compute_phases
+
+# Evaluate a junction just past its boundary so float rounding never lands
+# on the tail of the phase that is ending
+BOUNDARY_NUDGE = 1e-3
+
+
+class Subscription:
+    __slots__ = ("junction_ids", "_buffer", "_ready")
+
+    def __init__(self, junction_ids, max_pending):
+        self.junction_ids = frozenset(junction_ids)
+        # Slow consumers lose their oldest messages instead of growing memory
+        self._buffer = deque(maxlen=max_pending)
+        self._ready = asyncio.Event()
+
+    def push(self, message):
+        self._buffer.append(message)
+        self._ready.set()
+
+    async def get(self):
+        while not self._buffer:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._buffer.popleft()
+
+
+class PhaseBroadcaster:
+    def __init__(self, registry, clock=time.time, max_pending=16, read=None, boundaries=None,
+                 versions=None, refresh=1.0):
+        self.registry = registry
+        # Wraps plan gathers when another thread or process may be writing plans
+        self.read = read or (lambda gather: gather())
+        # boundaries(rows, now) -> live density boundaries (see density.py); versions: per-row state versions
+        self.boundaries = boundaries
+        self.versions = versions
+        self.refresh = refresh
+        self.clock = clock
+        self.max_pending = max_pending
+        self._subscribers = {}  # junction_id -> set of Subscription
+        self._deadlines = {}  # junction_id -> currently scheduled deadline
+        self._last_status = {}
+        self._versions = {}  # junction_id -> state version its deadline was computed at
+        self._heap = []
+        self._wakeup = asyncio.Event()
+
+    @property
+    def subscriber_count(self):
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    def subscribe(self, junction_ids):
+        subscription = Subscription(junction_ids, self.max_pending)
+        new_ids = []
+        for junction_id in subscription.junction_ids:
+            subs = self._subscribers.setdefault(junction_id, set())
+            subs.add(subscription)
+            if junction_id not in self._deadlines:
+                new_ids.append(junction_id)
+
+        now = self.clock()
+        if new_ids:
+            self._schedule(new_ids, now)
+            self._wakeup.set()
+        # Every subscriber starts from the phase currently in progress
+        for junction_id in subscription.junction_ids:
+            subscription.push(self._message(junction_id, now))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for junction_id in subscription.junction_ids:
+            subs = self._subscribers.get(junction_id)
+            if subs is None:
+                continue
+            subs.discard(subscription)
+            if not subs:
+                # The heap entry goes stale and is dropped when it falls due
+                del self._subscribers[junction_id]
+                self._deadlines.pop(junction_id, None)
+                self._last_status.pop(junction_id, None)
+                self._versions.pop(junction_id, None)
+
+    def _predict(self, junction_ids, now):
+        rows = self.registry.rows(junction_ids)
+
+        def gather():
+            versions = None if self.versions is None else self.versions[rows]
+            boundaries = None if self.boundaries is None else self.boundaries(rows, now)
+            return self.registry.plans[rows], boundaries, versions
+
+        plans, boundaries, versions = self.read(gather)
+        status, to_change = compute_phases(
+            now, plans["cycle_time"], plans["green"], plans["red"], plans["offset"]
+        )
+        if boundaries is not None:
+            status, to_change = apply_boundaries(now, status, to_change, boundaries)
+        return status, to_change, plans, versions
+
+    def _message(self, junction_id, now):
+        status, to_change, plans, _ = self._predict([junction_id], now)
+        return {
+            "junction_id": junction_id,
+            "current_status": str(STATUS_LABELS[status[0]]),
+            "seconds_to_change": round(float(to_change[0]), 1),
+            "cycle_time": int(plans["cycle_time"][0]),
+        }
+
+    def _schedule(self, junction_ids, now):
+        status, to_change, plans, versions = self._predict(junction_ids, now)
+        deadlines = now + to_change
+        for junction_id, code, deadline in zip(junction_ids, status.tolist(), deadlines.tolist()):
+            self._last_status[junction_id] = code
+            self._deadlines[junction_id] = deadline
+            heapq.heappush(self._heap, (deadline, junction_id))
+        if versions is not None:
+            self._versions.update(zip(junction_ids, versions.tolist()))
+        return status, to_change, plans
+
+    def _refresh_changed(self, now):
+        # Junctions whose plan or density changed since their deadline was computed
+        junction_ids = list(self._deadlines)
+        if self.versions is None or not junction_ids:
+            return
+        current = self.versions[self.registry.rows(junction_ids)].tolist()
+        changed = [j for j, version in zip(junction_ids, current) if self._versions.get(j) != version]
+        if not changed:
+            return
+        status, to_change, plans = self._schedule(changed, now)
+        self._push(changed, status, np.round(to_change, 1).tolist(), plans)
+
+    def _push(self, junction_ids, status, to_change, plans, previous=None):
+        labels = STATUS_LABELS[status].tolist()
+        cycles = plans["cycle_time"].astype(np.int64).tolist()
+        for i, junction_id in enumerate(junction_ids):
+            if previous is not None and status[i] == previous[i]:
+                continue
+            message = {
+                "junction_id": junction_id,
+                "current_status": labels[i],
+                "seconds_to_change": to_change[i],
+                "cycle_time": cycles[i],
+            }
+            for subscription in self._subscribers[junction_id]:
+                subscription.push(message)
+
+    def _fire_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, junction_id = heapq.heappop(self._heap)
+            if self._deadlines.get(junction_id) == deadline:
+                due.append(junction_id)
+        if not due:
+            return
+
+        previous = [self._last_status[junction_id] for junction_id in due]
+        status, to_change, plans = self._schedule(due, now + BOUNDARY_NUDGE)
+        # A deadline that fell due without a phase change (the plan moved meanwhile) only reschedules
+        self._push(due, status, np.round(to_change + BOUNDARY_NUDGE, 1).tolist(), plans, previous)
+
+    async def run(self):
+        while True:
+            now = self.clock()
+            self._refresh_changed(now)
+            self._fire_due(now)
+            timeout = self._heap[0][0] - now if self._heap else None
+            if self.versions is not None and self._deadlines:
+                timeout = self.refresh if timeout is None else min(timeout, self.refresh)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
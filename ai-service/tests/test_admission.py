@@ -0,0 +1,77 @@
+import asyncio
+
+from admission import AdmissionController, AdmissionMiddleware
+from metrics import ADMITTED_KEY, START_KEY, Metrics, MetricsMiddleware
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def call(middleware, peer, client_id=None):
+    headers = [(b"x-client-id", client_id.encode())] if client_id else []
+    scope = {"type": "http", "path": "/predict", "headers": headers, "client": (peer, 1234)}
+    statuses = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    asyncio.run(middleware(scope, None, send))
+    return statuses[0]
+
+
+def make(rate=None, burst=None):
+    controller = AdmissionController(rate=rate, burst=burst, clock=lambda: 0.0)
+    return AdmissionMiddleware(ok_app, controller, ("/predict",), trusted_proxies=("10.0.0.1",))
+
+
+def test_no_rate_limit_by_default():
+    middleware = make()
+    assert all(call(middleware, "10.0.0.9") == 200 for _ in range(1000))
+
+
+def test_rotating_client_ids_share_the_peer_bucket():
+    middleware = make(rate=1, burst=3)
+    statuses = [call(middleware, "10.0.0.9", f"vehicle-{i}") for i in range(5)]
+    assert statuses == [200, 200, 200, 429, 429]
+
+
+def test_trusted_proxy_forwards_client_ids():
+    middleware = make(rate=1, burst=2)
+    assert [call(middleware, "10.0.0.1", "a") for _ in range(3)] == [200, 200, 429]
+    assert call(middleware, "10.0.0.1", "b") == 200
+    # The proxy's own requests are not limited
+    assert all(call(middleware, "10.0.0.1") == 200 for _ in range(10))
+
+
+def test_queue_wait_is_reported_apart_from_validation():
+    class Request:
+        def __init__(self, scope):
+            self.scope = scope
+
+    metrics = Metrics()
+    controller = AdmissionController(max_concurrent=1)
+
+    async def slow_app(scope, receive, send):
+        # The handler validates as soon as it runs, however long it queued
+        metrics.mark_validated(Request(scope))
+        await asyncio.sleep(0.05)
+        await ok_app(scope, receive, send)
+
+    app = MetricsMiddleware(AdmissionMiddleware(slow_app, controller, ("/predict",)), metrics)
+    scopes = [{"type": "http", "path": "/predict", "headers": [], "client": ("10.0.0.9", 1)} for _ in range(2)]
+
+    async def send(message):
+        pass
+
+    async def main():
+        await asyncio.gather(*(app(scope, None, send) for scope in scopes))
+
+    asyncio.run(main())
+    waits = sorted(scope[ADMITTED_KEY] - scope[START_KEY] for scope in scopes)
+    assert waits[1] >= 0.04  # the second request queued behind the first
+    assert sum(metrics.stages["admission_queue"].counts) == 2
+    assert metrics.stages["admission_queue"].sum >= 0.04
+    assert metrics.stages["validation"].sum < 0.01
@@ -0,0 +1,67 @@
+import numpy as np
+
+from density import DensityCache, apply_boundaries, boundary_windows
+from phases import AMBER, GREEN, RED, compute_phases
+from signal_plans import SignalPlanRegistry
+
+# 60 s cycle: GREEN [0, 30), RED [30, 55), AMBER [55, 60) relative to a cycle start
+CYCLE_START = 1.7e9 - (1.7e9 % 60)
+
+
+def predict(registry, cache, t):
+    rows = np.array([0])
+    plans = registry.plans[rows]
+    status, to_change = compute_phases(np.array([t]), plans["cycle_time"], plans["green"], plans["red"],
+                                       plans["offset"])
+    status, to_change = apply_boundaries(np.array([t]), status, to_change, cache.boundaries(rows, now=t))
+    return int(status[0]), float(to_change[0])
+
+
+def setup(density, at):
+    registry = SignalPlanRegistry.from_records([{"id": "J1", "cycle_time": 60, "green": 30, "red": 25}])
+    cache = DensityCache(len(registry))
+    cache.update([0], [density], registry.plans, now=at)
+    return registry, cache
+
+
+def test_held_green_keeps_status_and_countdown_consistent():
+    start = CYCLE_START + 20  # 10 s of green left
+    registry, cache = setup(1.0, start)
+    ends = []
+    for t in np.arange(start, start + 14.9, 0.5):
+        status, to_change = predict(registry, cache, t)
+        assert status == GREEN
+        ends.append(t + to_change)
+    # One boundary, fixed when the sample arrived: 5 s past the scheduled end
+    assert np.allclose(ends, CYCLE_START + 35)
+    assert predict(registry, cache, CYCLE_START + 35.1)[0] == RED
+
+
+def test_shortened_red_moves_the_next_phase_forward():
+    start = CYCLE_START + 35  # 20 s of red left, density 0.5 -> 3 s earlier
+    registry, cache = setup(0.5, start)
+    status, to_change = predict(registry, cache, CYCLE_START + 51.9)
+    assert status == RED and np.isclose(to_change, 0.1)
+    status, to_change = predict(registry, cache, CYCLE_START + 53)
+    assert status == AMBER and np.isclose(to_change, 7.0)
+
+
+def test_lookahead_windows_follow_the_boundary():
+    start = CYCLE_START + 20
+    registry, cache = setup(1.0, start)
+    for t in (start, CYCLE_START + 31):
+        status, begin, end = boundary_windows(np.array([t]), 3, registry.plans[[0]],
+                                              cache.boundaries(np.array([0]), now=t))
+        assert status[0].tolist() == [GREEN, RED, AMBER]
+        assert np.allclose(end[0], [CYCLE_START + 35, CYCLE_START + 55, CYCLE_START + 60])
+        assert np.isclose(begin[0, 1], CYCLE_START + 35)
+
+
+def test_expired_sample_falls_back_to_the_plan():
+    start = CYCLE_START + 20
+    registry, cache = setup(1.0, start)
+    t = start + 31
+    assert cache.expired(now=t)
+    assert cache.expire(now=t).tolist() == [0]
+    assert not cache.expired(now=t)
+    assert predict(registry, cache, CYCLE_START + 32)[0] == RED
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from estimator import PlanEstimator
+from phases import AMBER, GREEN, RED, compute_phases
+from signal_plans import SignalPlanRegistry
+
+EPOCH = 1.7e9
+
+
+def replay(cycle, green, red, offset, jitter, cycles=40, seed=0):
+    """Feed jittered phase changes of a fixed-time plan; returns the learned plan and last event time."""
+    registry = SignalPlanRegistry.from_records([{"id": "J1", "cycle_time": 60}])
+    estimator = PlanEstimator(registry)
+    row = registry.row("J1")
+    rng = np.random.default_rng(seed)
+    first = offset + np.ceil((EPOCH - offset) / cycle) * cycle
+    timestamp = first
+    for k in range(cycles):
+        start = first + k * cycle
+        for status, at in ((GREEN, 0.0), (RED, green), (AMBER, green + red)):
+            timestamp = start + at + rng.normal(0, jitter)
+            estimator.observe(row, status, timestamp)
+    return registry.plans[row], timestamp
+
+
+@pytest.mark.parametrize("cycle, jitter, expected", [
+    (90.0, 0.0, 0.999),
+    (90.3, 0.0, 0.999),
+    (90.0, 0.3, 0.97),
+    (90.0, 1.0, 0.93),
+])
+def test_learned_plan_matches_schedule(cycle, jitter, expected):
+    plan, last = replay(cycle, 40.0, 45.0, 17.0, jitter)
+    query = last + np.arange(0, 600, 0.25)
+    truth, _ = compute_phases(query, cycle, 40.0, 45.0, 17.0)
+    learned, _ = compute_phases(query, plan["cycle_time"], plan["green"], plan["red"], plan["offset"])
+    assert (truth == learned).mean() >= expected
@@ -0,0 +1,25 @@
+import numpy as np
+
+from history import DENSITY_DTYPE, RingHistory
+
+
+def records(timestamps):
+    out = np.zeros(len(timestamps), dtype=DENSITY_DTYPE)
+    out["timestamp"] = timestamps
+    return out
+
+
+def test_out_of_order_records_are_dropped_per_junction(tmp_path):
+    history = RingHistory(str(tmp_path / "density"), DENSITY_DTYPE, ["J1", "J2"], capacity=8)
+    kept = history.append([0, 1, 0], records([100.0, 50.0, 110.0]))
+    assert kept.tolist() == [True, True, True]
+
+    # Older than J1's newest, then older than an earlier record of the same batch
+    kept = history.append([0, 1, 1, 0], records([105.0, 60.0, 55.0, np.nan]))
+    assert kept.tolist() == [False, True, False, False]
+    assert history.latest(0)["timestamp"].tolist() == [100.0, 110.0]
+    assert history.latest(1)["timestamp"].tolist() == [50.0, 60.0]
+
+    # Equal timestamps are kept, and range reads stay correct
+    assert history.append([0], records([110.0])).tolist() == [True]
+    assert history.between(0, 105.0, 111.0)["timestamp"].tolist() == [110.0, 110.0]
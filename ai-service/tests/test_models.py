@@ -0,0 +1,80 @@
+import threading
+
+import numpy as np
+import pytest
+
+from models import BinnedPlanModel, ModelRegistry, ScheduleModel, synthetic_features
+
+
+class GatedModel(ScheduleModel):
+    """Schedule model whose predict() waits for a gate and records what it served."""
+
+    def __init__(self, name):
+        self.name = name
+        self.served = []
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()  # open for warmup
+
+    def predict(self, features):
+        self.entered.set()
+        self.gate.wait()
+        self.served.append(len(features))
+        return super().predict(features)
+
+
+def test_activate_swaps_while_a_batch_finishes_on_the_old_model():
+    registry = ModelRegistry()
+    old, new = GatedModel("old"), GatedModel("new")
+    registry.register("old", lambda: old)
+    registry.register("new", lambda: new)
+    registry.activate("old")
+
+    old.entered.clear()
+    old.gate.clear()
+    results = []
+    worker = threading.Thread(target=lambda: results.append(registry.predict(synthetic_features(7))))
+    worker.start()
+    assert old.entered.wait(5)
+
+    # The batch in flight holds the old model; requests after the swap see the new one
+    registry.activate("new")
+    assert registry.active is new
+    registry.predict(synthetic_features(9))
+    assert new.served[-1] == 9
+    old.gate.set()
+    worker.join(5)
+    assert old.served[-1] == 7 and 7 not in new.served
+    assert len(results[0][0]) == 7
+
+
+class ShortBatchModel(ScheduleModel):
+    name = "short"
+
+    def predict(self, features):
+        status, to_change = super().predict(features)
+        return status[:-1], to_change[:-1]
+
+
+def test_warmup_rejects_a_model_returning_the_wrong_batch_size():
+    registry = ModelRegistry()
+    registry.register("schedule", ScheduleModel)
+    registry.register("short", ShortBatchModel)
+    registry.activate("schedule")
+    with pytest.raises(ValueError, match="wrong size"):
+        registry.activate("short")
+    assert registry.active.name == "schedule"
+    assert "short" not in registry.describe()["loaded"]
+
+
+def test_binned_model_stays_close_to_the_schedule():
+    model = BinnedPlanModel.train_synthetic()
+    features = synthetic_features(200_000, np.random.default_rng(1))
+    status, to_change = ScheduleModel().predict(features)
+    predicted, predicted_to_change = model.predict(features)
+
+    # Measured: 98.1% status agreement, median error 0.8 s, p99 23.5 s
+    assert np.mean(predicted == status) >= 0.975
+    error = np.abs(predicted_to_change - to_change)
+    assert np.median(error) <= 1.5
+    assert np.percentile(error, 99) <= 26.0
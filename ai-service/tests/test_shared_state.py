@@ -0,0 +1,30 @@
+import os
+import time
+
+from cache import PhaseWindowCache
+from shared_state import JunctionStateTable, unlink
+from signal_plans import SignalPlanRegistry
+
+
+def test_write_in_one_worker_invalidates_cached_windows_in_another():
+    name = f"glosa-test-{os.getpid()}"
+    records = [{"id": "J1", "cycle_time": 90}, {"id": "J2", "cycle_time": 60}]
+    first = JunctionStateTable(SignalPlanRegistry.from_records(records), (), name=name)
+    second = JunctionStateTable(SignalPlanRegistry.from_records(records), (), name=name)
+    try:
+        now = time.time()
+        cache = PhaseWindowCache()
+        cache.put("J1", now, now + 40.0, "GREEN", 90, first.version(0))
+        cache.put("J2", now, now + 30.0, "GREEN", 60, first.version(1))
+
+        with second.write():
+            second["plans"][0]["green"] = 50.0
+            second.touch([0])
+
+        assert cache.get("J1", now + 10.0, first.version(0)) is None
+        assert cache.get("J2", now + 10.0, first.version(1)) is not None
+        assert cache.invalidations == 1
+    finally:
+        first.close()
+        second.close()
+        unlink(name)
@@ -0,0 +1,89 @@
+import asyncio
+
+import numpy as np
+
+from density import DensityCache, apply_boundaries
+from phases import GREEN, RED, compute_phases
+from shared_state import JunctionStateTable
+from signal_plans import SignalPlanRegistry
+from streaming import PhaseBroadcaster
+
+# 60 s cycle: GREEN [0, 30), RED [30, 55), AMBER [55, 60) relative to a cycle start
+CYCLE_START = 1.7e9 - (1.7e9 % 60)
+
+
+def setup(now):
+    registry = SignalPlanRegistry.from_records([{"id": "J1", "cycle_time": 60, "green": 30, "red": 25}])
+    state = JunctionStateTable(registry, ())
+    densities = DensityCache(len(registry), clock=lambda: now[0])
+    broadcaster = PhaseBroadcaster(registry, clock=lambda: now[0], read=state.read,
+                                   boundaries=densities.boundaries, versions=state["version"])
+    return registry, state, densities, broadcaster
+
+
+def drain(subscription):
+    messages = []
+    while subscription._buffer:
+        messages.append(asyncio.run(subscription.get()))
+    return messages
+
+
+def predicted_status(registry, densities, t):
+    plans = registry.plans[[0]]
+    status, to_change = compute_phases(t, plans["cycle_time"], plans["green"], plans["red"], plans["offset"])
+    return int(apply_boundaries(t, status, to_change, densities.boundaries(np.array([0]), t))[0][0])
+
+
+def test_stream_countdown_follows_density_written_later():
+    now = [CYCLE_START + 20]
+    registry, state, densities, broadcaster = setup(now)
+    subscription = broadcaster.subscribe(["J1"])
+    assert drain(subscription)[0]["seconds_to_change"] == 10.0
+
+    with state.write():
+        state.touch(densities.update([0], [0.8], registry.plans, now=now[0]))
+    broadcaster._refresh_changed(now[0])
+    corrected, = drain(subscription)
+    assert corrected["current_status"] == "GREEN"
+    assert corrected["seconds_to_change"] == 14.0  # 10 s + 10 * 0.5 * 0.8
+
+
+def test_stream_pushes_red_when_the_held_green_ends():
+    now = [CYCLE_START + 20]
+    registry, state, densities, broadcaster = setup(now)
+    subscription = broadcaster.subscribe(["J1"])
+    with state.write():
+        state.touch(densities.update([0], [1.0], registry.plans, now=now[0]))
+
+    pushed_red = predicted_red = None
+    for t in np.arange(CYCLE_START + 20, CYCLE_START + 40, 0.1):
+        now[0] = float(t)
+        broadcaster._refresh_changed(now[0])
+        broadcaster._fire_due(now[0])
+        messages = drain(subscription)
+        if pushed_red is None and any(m["current_status"] == "RED" for m in messages):
+            pushed_red = now[0]
+        if predicted_red is None and predicted_status(registry, densities, now[0]) == RED:
+            predicted_red = now[0]
+    # Green is held 5 s past the scheduled end; the stream flips exactly when /predict does
+    assert predicted_red is not None and np.isclose(predicted_red, CYCLE_START + 35, atol=0.1)
+    assert pushed_red == predicted_red
+
+
+def test_stream_returns_to_the_plan_when_a_sample_expires():
+    now = [CYCLE_START + 20]
+    registry, state, densities, broadcaster = setup(now)
+    densities.ttl = 2.0
+    subscription = broadcaster.subscribe(["J1"])
+    with state.write():
+        state.touch(densities.update([0], [1.0], registry.plans, now=now[0]))
+    broadcaster._refresh_changed(now[0])
+    assert drain(subscription)[-1]["seconds_to_change"] == 15.0
+
+    now[0] += 3.0
+    with state.write():
+        state.touch(densities.expire(now[0]))
+    broadcaster._refresh_changed(now[0])
+    message, = drain(subscription)
+    assert message["current_status"] == "GREEN" and message["seconds_to_change"] == 7.0
+    assert predicted_status(registry, densities, now[0]) == GREEN
@@ -0,0 +1,114 @@
+"""
+Response encodings negotiated from the Accept header.
+
+- application/json: the default, serialized with orjson when it is
+  installed (NumPy columns are passed through without building lists).
+- application/msgpack: the JSON document as MessagePack, if msgpack is
+  installed.
+- application/x-glosa-struct: fixed-width little-endian columns. Junction
+  IDs are not repeated; entry i answers the i-th junction of the request.
+
+Struct layout: a 12-byte header (magic b"GLSA", u8 version, u8 kind,
+u16 reserved, u32 count), then whole columns ordered widest first so every
+column stays naturally aligned:
+
+    kind 1, prediction: f32 seconds_to_change, u16 cycle_time, u8 status
+    kind 2, advisory:   f32 seconds_to_change, u32 distance, u8 status,
+                        u8 recommended_speed (km/h), u8 message
+
+Status codes are 0 GREEN, 1 RED, 2 AMBER; message codes index
+advisory.MESSAGES.
+"""
+import json
+import struct
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+STRUCT = "application/x-glosa-struct"
+
+MAGIC = b"GLSA"
+VERSION = 1
+PREDICTION, ADVISORY = 1, 2
+HEADER = struct.Struct("<4sBBHI")
+
+PREDICTION_COLUMNS = (("seconds_to_change", "<f4"), ("cycle_time", "<u2"), ("status", "u1"))
+ADVISORY_COLUMNS = (("seconds_to_change", "<f4"), ("distance", "<u4"), ("status", "u1"),
+                    ("recommended_speed", "u1"), ("message", "u1"))
+
+
+def available():
+    types = [JSON, STRUCT]
+    if msgpack is not None:
+        types.insert(1, MSGPACK)
+    return types
+
+
+def negotiate(accept):
+    """Pick the first supported media type the client accepts, else JSON."""
+    if not accept:
+        return JSON
+    supported = available()
+    ranked = []
+    for position, part in enumerate(accept.split(",")):
+        media, *params = [p.strip() for p in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media in supported and quality > 0:
+            ranked.append((-quality, position, media))
+    return min(ranked)[2] if ranked else JSON
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"cannot serialize {type(value).__name__}")
+
+
+def dumps_json(document):
+    if orjson is not None:
+        return orjson.dumps(document, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(document, separators=(",", ":"), default=_json_default).encode()
+
+
+def dumps_msgpack(document):
+    return msgpack.packb(document, default=_json_default, use_bin_type=True)
+
+
+def pack_columns(kind, layout, columns):
+    count = len(columns[layout[0][0]])
+    parts = [HEADER.pack(MAGIC, VERSION, kind, 0, count)]
+    for name, dtype in layout:
+        parts.append(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+    return b"".join(parts)
+
+
+def unpack_columns(payload):
+    """Decode a struct payload back into NumPy columns (for clients and tests)."""
+    magic, version, kind, _, count = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a GLOSA struct payload")
+    layout = PREDICTION_COLUMNS if kind == PREDICTION else ADVISORY_COLUMNS
+    columns, offset = {}, HEADER.size
+    for name, dtype in layout:
+        columns[name] = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        offset += count * np.dtype(dtype).itemsize
+    return kind, columns